@@ -0,0 +1,587 @@
+# -*- coding: utf-8 -*-
+"""
+compressed numpy arrays stored as cells of jmt tables.
+
+each cell is an array [dtype, shape, data], where data is the base64 text
+of the compressed bytes of the array, for example:
+
+    {"name": "images", "columns": ["id", "image"], "array_columns": ["image"], "data_compression": "gzip"}
+    [1, ["|u1", [2, 2], "H4sIAAAAAAACA2NkYmYBAM37PLYEAAAA"]]
+
+the `array_columns` key of the header lists the columns holding the cells,
+and `data_compression` the codec used for them (see `Codec`).
+
+large arrays can be stored in tiles, each compressed on its own: the
+`array_chunks` key of the header gives the tile shape of each column, and
+the data of the cell is the list of the tiles, in C order over the grid.
+A region of a tiled array is read decompressing only the tiles it overlaps.
+"""
+
+# %% do imports
+import bz2
+import gzip
+import lzma
+import zlib
+import base64
+import itertools as it
+from functools import partial
+from typing import Any, Callable, Iterable, List, Mapping, Optional
+
+import numpy as np
+
+# %% codecs
+
+def _gzip_decompress(compressed: bytes) -> bytes:
+    # zlib is faster than gzip.decompress, and releases the GIL
+    return zlib.decompress(compressed, 16 + zlib.MAX_WBITS)
+
+# for each codec name, a function building the compression from the
+# parameters of the codec, and the decompression
+CODECS = {
+    "none": (lambda: bytes, bytes),
+    # without the time in the header the same array gives the same text
+    "gzip": (lambda level=6: partial(gzip.compress, compresslevel=level, mtime=0),
+             _gzip_decompress),
+    "zlib": (lambda level=6: partial(zlib.compress, level=level), zlib.decompress),
+    "bz2": (lambda level=9: partial(bz2.compress, compresslevel=level), bz2.decompress),
+    "lzma": (lambda preset=6: partial(lzma.compress, preset=preset), lzma.decompress),
+    }
+
+def register_codec(name: str, compression: Callable, decompression: Callable):
+    """add a codec: compression builds the function compressing the bytes
+    from the parameters of the codec, decompression reverts it
+    """
+    CODECS[name] = (compression, decompression)
+
+def _shuffle(data: bytes, itemsize: int) -> bytes:
+    """group together the bytes with the same position in the items"""
+    if itemsize == 1 or not data:
+        return data
+    return np.frombuffer(data, dtype="u1").reshape(-1, itemsize).T.tobytes()
+
+def _unshuffle(data: bytes, itemsize: int) -> bytes:
+    if itemsize == 1 or not data:
+        return data
+    return np.frombuffer(data, dtype="u1").reshape(itemsize, -1).T.tobytes()
+
+class Codec:
+    """compression of the array bytes, with the parameters of the codec.
+
+    with shuffle=True the bytes of the items are reordered before the
+    compression, first byte of all the items, then the second and so on:
+    for numeric arrays the similar high bytes end up together, and the
+    result usually compresses better and faster.
+    The spec of the codec is stored in the `data_compression` key of the
+    header, as the name alone or a mapping with the parameters.
+    """
+    def __init__(self, name: str = "gzip", shuffle: bool = False, **params):
+        if name not in CODECS:
+            raise ValueError("unknown data compression: {!r}".format(name))
+        self.name = name
+        self.shuffle = shuffle
+        self.params = params
+        compression, self._decompress = CODECS[name]
+        self._compress = compression(**params)
+
+    @property
+    def spec(self):
+        if not self.params and not self.shuffle:
+            return self.name
+        spec = dict(codec=self.name, **self.params)
+        if self.shuffle:
+            spec["shuffle"] = True
+        return spec
+
+    def compress(self, arr) -> bytes:
+        data = arr.tobytes()
+        if self.shuffle:
+            data = _shuffle(data, arr.itemsize)
+        return self._compress(data)
+
+    def decompress(self, compressed: bytes, dtype) -> bytes:
+        data = self._decompress(compressed)
+        if self.shuffle:
+            data = _unshuffle(data, np.dtype(dtype).itemsize)
+        return data
+
+    def __eq__(self, other):
+        if not isinstance(other, Codec):
+            return NotImplemented
+        return self.spec == other.spec
+
+    def __repr__(self) -> str:
+        return "{}({!r})".format(self.__class__.__qualname__, self.spec)
+
+def get_codec(spec) -> Codec:
+    """the codec of a spec: a name, a mapping with the codec name and
+    its parameters, or a codec itself
+    """
+    if isinstance(spec, Codec):
+        return spec
+    if isinstance(spec, str):
+        return Codec(spec)
+    if isinstance(spec, Mapping):
+        params = dict(spec)
+        return Codec(params.pop("codec"), **params)
+    raise ValueError("unknown data compression: {!r}".format(spec))
+
+# %% compression of the single arrays
+
+def compress_array(arr, codec="gzip") -> list:
+    """encode an array as a [dtype, shape, base64 data] cell.
+
+    codec is a spec for `get_codec`, or a function compressing the array.
+    """
+    arr = np.ascontiguousarray(arr)
+    if callable(codec) and not isinstance(codec, Codec):
+        compressed = codec(arr)
+    else:
+        compressed = get_codec(codec).compress(arr)
+    encoded = base64.b64encode(compressed).decode("ascii")
+    return [arr.dtype.str, list(arr.shape), encoded]
+
+def decompress_array(dtype, shape, base64_str, codec="gzip"):
+    """decode a [dtype, shape, base64 data] cell in a read only array.
+
+    codec is a spec for `get_codec`, or a function decompressing the bytes.
+    """
+    compressed = base64.b64decode(base64_str)
+    if callable(codec) and not isinstance(codec, Codec):
+        data_rebuild = codec(compressed)
+    else:
+        data_rebuild = get_codec(codec).decompress(compressed, dtype)
+    return np.frombuffer(data_rebuild, dtype=dtype).reshape(shape)
+
+def is_array_cell(value) -> bool:
+    """check if a value has the structure of a compressed array cell"""
+    return (
+        isinstance(value, (list, tuple))
+        and len(value) == 3
+        and isinstance(value[0], str)
+        and isinstance(value[1], (list, tuple))
+        and isinstance(value[2], (str, list))
+        )
+
+# %% tiled arrays
+
+def _tile_ranges(shape, chunks) -> List[List[range]]:
+    """for each dimension the ranges of indexes covered by its tiles"""
+    if len(chunks) != len(shape):
+        raise ValueError("chunks {} do not match the shape {}".format(chunks, shape))
+    return [
+        [range(start, min(start + chunk, size)) for start in range(0, size, chunk)]
+        for size, chunk in zip(shape, chunks)
+        ]
+
+def compress_tiled(arr, chunks, codec="gzip") -> list:
+    """encode an array as a [dtype, shape, tiles] cell, compressing each
+    tile of shape `chunks` on its own
+    """
+    arr = np.asarray(arr)
+    codec = get_codec(codec)
+    tiles = []
+    for ranges in it.product(*_tile_ranges(arr.shape, chunks)):
+        region = tuple(slice(r.start, r.stop) for r in ranges)
+        tile = np.ascontiguousarray(arr[region])
+        tiles.append(base64.b64encode(codec.compress(tile)).decode("ascii"))
+    return [arr.dtype.str, list(arr.shape), tiles]
+
+def _decode_tiles(dtype, shape, tiles, chunks, key, codec, workers):
+    """the region of the array with the given slices, from the tiles"""
+    grid = _tile_ranges(shape, chunks)
+    grid_shape = [len(ranges) for ranges in grid]
+    # the tiles overlapping the region in each dimension
+    overlaps = lambda r, bound: r.start < bound.stop and bound.start < r.stop
+    overlapping = [
+        [idx for idx, r in enumerate(ranges) if overlaps(r, bound)]
+        for ranges, bound in zip(grid, key)
+        ]
+    out = np.empty([bound.stop - bound.start for bound in key], dtype=dtype)
+    if out.size == 0:
+        return out
+    positions = list(it.product(*overlapping))
+    def decode(position):
+        tile_shape = [len(grid[dim][idx]) for dim, idx in enumerate(position)]
+        tile = tiles[int(np.ravel_multi_index(position, grid_shape))]
+        return decompress_array(dtype, tile_shape, tile, codec)
+    if workers == 1 or len(positions) < 2:
+        decoded = map(decode, positions)
+    else:
+        from concurrent.futures import ThreadPoolExecutor
+        with ThreadPoolExecutor(workers) as pool:
+            decoded = list(pool.map(decode, positions))
+    for position, tile in zip(positions, decoded):
+        source, dest = [], []
+        for dim, idx in enumerate(position):
+            r, bound = grid[dim][idx], key[dim]
+            start, stop = max(r.start, bound.start), min(r.stop, bound.stop)
+            source.append(slice(start - r.start, stop - r.start))
+            dest.append(slice(start - bound.start, stop - bound.start))
+        out[tuple(dest)] = tile[tuple(source)]
+    return out
+
+def decompress_tiled(dtype, shape, tiles, chunks, codec="gzip",
+                     workers: Optional[int] = None):
+    """decode a tiled cell in the whole array, decompressing the tiles in threads"""
+    key = [slice(0, size) for size in shape]
+    return _decode_tiles(dtype, shape, tiles, chunks, key, codec, workers)
+
+def read_region(cell, chunks, key, codec="gzip",
+                workers: Optional[int] = None):
+    """the values of a tiled cell at a numpy index, made of integers and
+    slices, decompressing only the tiles that overlap it
+    """
+    dtype, shape, tiles = cell
+    if not isinstance(key, tuple):
+        key = (key,)
+    if len(key) > len(shape):
+        raise IndexError("too many indices for a {}d array".format(len(shape)))
+    key = key + (slice(None),) * (len(shape) - len(key))
+    bounds, relative = [], []
+    for item, size in zip(key, shape):
+        if isinstance(item, slice):
+            selected = range(*item.indices(size))
+            if not selected:
+                bounds.append(slice(0, 0))
+                relative.append(slice(0, 0))
+                continue
+            low, high = min(selected), max(selected) + 1
+            stop = selected.start - low + len(selected) * selected.step
+            bounds.append(slice(low, high))
+            stop = stop if stop >= 0 else None
+            relative.append(slice(selected.start - low, stop, selected.step))
+        else:
+            idx = int(item) + size if item < 0 else int(item)
+            if not 0 <= idx < size:
+                raise IndexError("index {} is out of bounds for size {}".format(item, size))
+            bounds.append(slice(idx, idx + 1))
+            relative.append(0)
+    region = _decode_tiles(dtype, shape, tiles, chunks, bounds, codec, workers)
+    return region[tuple(relative)]
+
+# %% lazy decoding
+
+class LazyArray:
+    """array cell that is decompressed only when its values are accessed.
+
+    dtype, shape and the cell itself are available without decompressing,
+    so a table can be written again without compressing it a second time.
+    For tiled cells (with the chunks) indexing decompresses only the tiles
+    of the region, without loading the whole array.
+    """
+    __slots__ = ("cell", "codec", "chunks", "_array")
+
+    def __init__(self, cell, codec="gzip", chunks=None):
+        self.cell = cell
+        self.codec = codec
+        self.chunks = chunks
+        self._array = None
+
+    @property
+    def dtype(self):
+        return np.dtype(self.cell[0])
+
+    @property
+    def shape(self):
+        return tuple(self.cell[1])
+
+    @property
+    def loaded(self) -> bool:
+        return self._array is not None
+
+    @property
+    def value(self) -> np.ndarray:
+        """the decompressed array, decoded at the first access"""
+        if self._array is None:
+            self._array = self._decode()
+        return self._array
+
+    def _decode(self) -> np.ndarray:
+        if self.chunks is not None:
+            # the caller is often already in a pool of threads
+            return decompress_tiled(*self.cell, self.chunks, self.codec, workers=1)
+        return decompress_array(*self.cell, self.codec)
+
+    def __array__(self, dtype=None, copy=None):
+        arr = self.value
+        return arr if dtype is None else arr.astype(dtype)
+
+    def __len__(self):
+        return self.shape[0]
+
+    def __getitem__(self, key):
+        if self._array is None and self.chunks is not None:
+            return read_region(self.cell, self.chunks, key, self.codec)
+        return self.value[key]
+
+    def __eq__(self, other):
+        if isinstance(other, LazyArray):
+            return self.cell == other.cell
+        return NotImplemented
+
+    def __repr__(self) -> str:
+        return "{}(dtype={}, shape={}, loaded={})".format(
+            self.__class__.__qualname__,
+            self.dtype,
+            self.shape,
+            self.loaded,
+            )
+
+def load_arrays(arrays: Iterable[LazyArray], workers: Optional[int] = None):
+    """decompress many lazy arrays concurrently in a pool of threads.
+
+    zlib releases the GIL while decompressing, so the threads run in
+    parallel. The arrays already loaded are skipped.
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    pending = [arr for arr in arrays if not arr.loaded]
+    if workers == 1 or len(pending) < 2:
+        for arr in pending:
+            arr.value
+        return
+    with ThreadPoolExecutor(workers) as pool:
+        for arr, value in zip(pending, pool.map(LazyArray._decode, pending)):
+            arr._array = value
+
+# %% decoding and encoding of whole tables
+
+def _array_column_indexes(info: Mapping[str, Any]) -> List[int]:
+    columns = info["columns"]
+    return [columns.index(name) for name in info.get("array_columns", [])]
+
+def _same_type(table, info, rows):
+    """a table of the same type of the given one, with the rows.
+
+    the types that store the data by columns, like `jmt.jmt.ColumnarTable`,
+    are built with their `from_rows` class method.
+    """
+    from_rows = getattr(type(table), "from_rows", None)
+    if from_rows is not None:
+        return from_rows(info, rows)
+    return type(table)(info, rows)
+
+def decode_table(table, lazy: bool = True, workers: Optional[int] = None):
+    """replace the cells of the array columns with arrays.
+
+    with lazy=True the cells become `LazyArray`, decoded when accessed,
+    otherwise they are all decompressed at once in a pool of threads.
+    The tiled columns are the ones in the `array_chunks` key of the header.
+    works with any table with info and data, returning the same type,
+    see `_same_type`.
+    """
+    info = table.info
+    indexes = _array_column_indexes(info)
+    if not indexes:
+        return table
+    codec = get_codec(info.get("data_compression", "gzip"))
+    array_chunks = info.get("array_chunks", {})
+    chunks = [array_chunks.get(info["columns"][idx]) for idx in indexes]
+    data = [list(row) for row in table.data]
+    cells = []
+    for row in data:
+        for idx, column_chunks in zip(indexes, chunks):
+            if row[idx] is not None:
+                row[idx] = LazyArray(row[idx], codec, column_chunks)
+                cells.append(row[idx])
+    if not lazy:
+        load_arrays(cells, workers)
+        for row in data:
+            for idx in indexes:
+                if row[idx] is not None:
+                    row[idx] = row[idx].value
+    return _same_type(table, info, data)
+
+def encode_table(table, columns: Optional[Iterable[str]] = None, chunks=None,
+                 codec="gzip"):
+    """replace the arrays in the table with compressed cells.
+
+    by default the columns holding numpy arrays (or lazy arrays) in the
+    first row are encoded; they are recorded in the header together with
+    the compression. The lazy arrays are written back without recompressing.
+    chunks is the shape of the tiles, the same for all the columns or a
+    mapping by column, to store the arrays in tiles (see `compress_tiled`).
+    codec is the spec of the compression, see `get_codec`.
+    """
+    data = [list(row) for row in table.data]
+    all_columns = table.info["columns"]
+    if columns is None:
+        is_array = lambda value: isinstance(value, (np.ndarray, LazyArray))
+        first = data[0] if data else []
+        columns = [name for name, v in zip(all_columns, first) if is_array(v)]
+    columns = list(columns)
+    if not columns:
+        return table
+    if chunks is None:
+        chunks = {}
+    elif not isinstance(chunks, Mapping):
+        chunks = {name: chunks for name in columns}
+    chunks = {name: list(chunks[name]) for name in columns if chunks.get(name)}
+    codec = get_codec(codec)
+    indexes = [all_columns.index(name) for name in columns]
+    same_codec = lambda value: get_codec(value.codec) == codec
+    for row in data:
+        for idx in indexes:
+            value, column_chunks = row[idx], chunks.get(all_columns[idx])
+            is_lazy = isinstance(value, LazyArray)
+            if is_lazy and value.chunks == column_chunks and same_codec(value):
+                row[idx] = list(value.cell)
+            elif value is not None and column_chunks is not None:
+                row[idx] = compress_tiled(np.asarray(value), column_chunks, codec)
+            elif value is not None:
+                row[idx] = compress_array(value, codec)
+    info = dict(table.info, array_columns=columns, data_compression=codec.spec)
+    if chunks:
+        info["array_chunks"] = chunks
+    return _same_type(table, info, data)
+
+# %% tests
+
+class _Table:
+    """minimal table to test the functions without other modules"""
+    def __init__(self, info, data):
+        self.info = info
+        self.data = data
+
+def test_compress_array():
+    for arr in [
+            np.arange(12, dtype="float64").reshape(3, 4),
+            np.random.randint(256, size=(5, 6, 3)).astype("uint8"),
+            np.arange(4, dtype=">i4"),
+            np.zeros((0, 2), dtype="int16"),
+            ]:
+        cell = compress_array(arr)
+        assert is_array_cell(cell)
+        rebuilt = decompress_array(*cell)
+        assert rebuilt.dtype == arr.dtype and rebuilt.shape == arr.shape
+        assert np.array_equal(rebuilt, arr)
+    # the text does not depend on the time of the compression
+    assert compress_array(np.arange(3)) == compress_array(np.arange(3))
+    # a transposed view is stored with its logical order
+    arr = np.arange(6).reshape(2, 3).T
+    assert np.array_equal(decompress_array(*compress_array(arr)), arr)
+
+def test_lazy_array():
+    arr = np.arange(20, dtype="int32").reshape(4, 5)
+    lazy = LazyArray(compress_array(arr))
+    assert lazy.shape == (4, 5) and lazy.dtype == np.dtype("int32")
+    assert not lazy.loaded
+    assert lazy[1, 2] == 7 and lazy.loaded
+    assert np.array_equal(np.asarray(lazy), arr)
+    arrays = [LazyArray(compress_array(arr + idx)) for idx in range(10)]
+    load_arrays(arrays, workers=4)
+    assert all(a.loaded for a in arrays)
+    assert all(np.array_equal(a.value, arr + idx) for idx, a in enumerate(arrays))
+
+def test_encode_decode_table():
+    images = [np.full((3, 3), idx, dtype="uint8") for idx in range(5)]
+    info = {"name": "images", "columns": ["id", "image"]}
+    table = _Table(info, [[idx, image] for idx, image in enumerate(images)])
+    encoded = encode_table(table)
+    assert encoded.info["array_columns"] == ["image"]
+    assert encoded.info["data_compression"] == "gzip"
+    assert all(is_array_cell(row[1]) for row in encoded.data)
+    lazy = decode_table(encoded)
+    assert isinstance(lazy, _Table)
+    assert all(isinstance(row[1], LazyArray) for row in lazy.data)
+    assert encode_table(lazy).data == encoded.data
+    eager = decode_table(encoded, lazy=False, workers=2)
+    assert all(np.array_equal(row[1], image) for row, image in zip(eager.data, images))
+
+def test_codecs():
+    arrays = [
+        np.linspace(0, 1, 1000).astype("float32"),
+        np.arange(1000, dtype="int64").reshape(10, 100),
+        np.arange(256, dtype="uint8"),
+        ]
+    specs = [
+        "none", "zlib", "bz2", "lzma",
+        {"codec": "gzip", "level": 1},
+        {"codec": "zlib", "level": 9, "shuffle": True},
+        {"codec": "lzma", "preset": 1, "shuffle": True},
+        ]
+    for spec in specs:
+        codec = get_codec(spec)
+        assert codec.spec == spec and get_codec(codec.spec) == codec
+        for arr in arrays:
+            assert np.array_equal(decompress_array(*compress_array(arr, spec), spec), arr)
+    # the shuffle helps with smooth float values
+    arr = arrays[0]
+    plain = compress_array(arr, {"codec": "zlib"})[2]
+    shuffled = compress_array(arr, {"codec": "zlib", "shuffle": True})[2]
+    assert len(shuffled) < len(plain)
+    try:
+        get_codec("snappy")
+    except ValueError:
+        pass
+    else:
+        raise AssertionError("the codec is not registered")
+    table = _Table({"name": "values", "columns": ["x"]}, [[arr], [arrays[1]]])
+    spec = {"codec": "bz2", "level": 5, "shuffle": True}
+    encoded = encode_table(table, codec=spec)
+    assert encoded.info["data_compression"] == spec
+    decoded = decode_table(encoded, lazy=False)
+    assert np.array_equal(decoded.data[1][0], arrays[1])
+    # a different codec compresses again the lazy arrays
+    recoded = encode_table(decode_table(encoded), codec="gzip")
+    assert np.array_equal(decode_table(recoded).data[0][0].value, arr)
+
+def test_tiled_arrays():
+    arr = np.arange(80 * 60, dtype="int32").reshape(80, 60)
+    cell = compress_tiled(arr, [32, 25])
+    assert is_array_cell(cell) and len(cell[2]) == 3 * 3
+    assert np.array_equal(decompress_tiled(*cell, [32, 25]), arr)
+    assert np.array_equal(decompress_tiled(*cell, [32, 25], workers=1), arr)
+    for key in [
+            (slice(10, 20), slice(30, 40)),
+            (5, slice(None)),
+            (slice(None, None, 7), -1),
+            (slice(70, 10, -3), slice(59, None, -11)),
+            slice(33, 34),
+            (slice(5, 5),),
+            ]:
+        assert np.array_equal(read_region(cell, [32, 25], key), arr[key])
+    # only the tiles overlapping the region are decompressed
+    decompressed = []
+    def counting(compressed):
+        decompressed.append(compressed)
+        return _gzip_decompress(compressed)
+    lazy = LazyArray(cell, counting, [32, 25])
+    assert np.array_equal(lazy[40:50, 30:40], arr[40:50, 30:40])
+    assert len(decompressed) == 1 and not lazy.loaded
+    table = _Table({"name": "images", "columns": ["image"]}, [[arr]])
+    encoded = encode_table(table, chunks=(32, 25))
+    assert encoded.info["array_chunks"] == {"image": [32, 25]}
+    assert encoded.data[0][0] == cell
+    decoded = decode_table(encoded)
+    assert decoded.data[0][0].chunks == [32, 25]
+    assert encode_table(decoded, chunks={"image": [32, 25]}).data == encoded.data
+    assert np.array_equal(decode_table(encoded, lazy=False).data[0][0], arr)
+
+def test_arrays_in_jtm_file():
+    import os
+    import tempfile
+    from jmt.jmt import Table, ColumnarTable, DataBase, write_into_jsontable, read_from_jsontable
+    image = np.arange(16, dtype="float32").reshape(4, 4)
+    table = Table(
+        info={"name": "images", "columns": ["id", "image"]},
+        data=[[0, image], [1, None]],
+        )
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "images.jtm")
+        write_into_jsontable(DataBase({"images": encode_table(table)}), filename)
+        loaded = decode_table(read_from_jsontable(filename).tables["images"])
+        for lazy in (False, True):
+            database = read_from_jsontable(filename, lazy=lazy, arrays=True)
+            decoded = database.tables["images"]
+            assert isinstance(decoded.data[0][1], LazyArray)
+            assert np.array_equal(decoded.data[0][1].value, image)
+            assert decoded.data[1][1] is None
+    assert isinstance(loaded, Table)
+    assert np.array_equal(loaded.data[0][1], image) and loaded.data[1][1] is None
+    # the tables stored by columns are rebuilt from the rows
+    columnar = encode_table(table).to_columnar()
+    assert type(columnar) is ColumnarTable
+    decoded = decode_table(columnar)
+    assert type(decoded) is ColumnarTable
+    assert np.array_equal(decoded[0][1].value, image) and decoded[1][1] is None
+    assert decode_table(encode_table(table.to_columnar())).info == decoded.info
@@ -7,19 +7,383 @@ Created on Sun Jan 17 22:35:38 2021
 """
 
 # %% do imports
+import io
 import os
 import re
+import sys
+import mmap
 import contextlib
+import sqlite3
 from sqlite3 import connect, Row
 from contextlib import closing
-from typing import Any, Mapping, Iterable
+from typing import Any, Mapping, Iterable, Tuple, Union, List, Optional, Set
+from typing import NamedTuple
+from collections.abc import Mapping as abcMapping
+from collections.abc import Sequence as abcSequence
 import json
+import zlib
+import array
+import bisect
+import struct
+import gc
+import hashlib
+import importlib
 from functools import partial
 import operator as op
 import itertools as it
-# I would rather not depend from it, but for now we can't avoid it
-import pandas as pd
-from openpyxl import load_workbook, Workbook
+# pandas, numpy and openpyxl are imported only by the functions using them,
+# as they take most of the startup time of the command line
+
+# %% json encoding and decoding
+
+class JSONCodec:
+    """json encoder and decoder used for all the lines of the jmt files.
+
+    it can use a faster library if installed (orjson or ujson).
+    In strict mode the encoding is always done by the standard library,
+    so the written files are byte-identical whatever the backend, and the
+    faster library is only used to decode.
+    Values that the faster libraries don't support (NaN, very large
+    integers, ...) are decoded and encoded falling back on the standard
+    library, so that the data never changes.
+    """
+    backends = ("orjson", "ujson", "json")
+    # orjson silently turns integers out of the 64 bit range into floats,
+    # so the lines with long sequences of digits are left to the stdlib
+    _long_digits = re.compile(r"[0-9]{19}")
+    _long_digits_bytes = re.compile(rb"[0-9]{19}")
+
+    def __init__(self, backend="auto", strict=True):
+        if backend == "auto":
+            backend = next(filter(_import_optional, self.backends))
+        if backend not in self.backends:
+            raise ValueError("unknown json backend: {}".format(backend))
+        module = _import_optional(backend)
+        if module is None:
+            raise ValueError("json backend not installed: {}".format(backend))
+        self.backend = backend
+        self.strict = strict
+        self._fast_loads = module.loads
+        if strict or backend == "json":
+            self.dumps = json.dumps
+        elif backend == "orjson":
+            self._fast_dumps = lambda obj: module.dumps(obj).decode("utf8")
+        else:
+            self._fast_dumps = partial(
+                module.dumps, ensure_ascii=False, escape_forward_slashes=False,
+                )
+        if backend == "json":
+            self.loads = json.loads
+
+    def __repr__(self) -> str:
+        return "{}(backend={!r}, strict={})".format(
+            self.__class__.__qualname__,
+            self.backend,
+            self.strict,
+            )
+
+    def dumps(self, obj) -> str:
+        try:
+            encoded = self._fast_dumps(obj)
+        except (TypeError, ValueError, OverflowError):
+            # integers out of the 64 bit range, or NaN for some libraries
+            return json.dumps(obj)
+        # orjson writes NaN and infinity as null
+        if "null" in encoded and _has_non_finite(obj):
+            return json.dumps(obj)
+        return encoded
+
+    def loads(self, data):
+        if isinstance(data, str):
+            long_digits = self._long_digits.search(data)
+        else:
+            long_digits = self._long_digits_bytes.search(data)
+        if long_digits is None:
+            try:
+                return self._fast_loads(data)
+            except (ValueError, OverflowError):
+                pass
+        return json.loads(data)
+
+def _has_non_finite(obj) -> bool:
+    """check if there are NaN or infinite floats in the value"""
+    if type(obj) is float:
+        return obj != obj or obj in (float("inf"), float("-inf"))
+    if isinstance(obj, (list, tuple)):
+        return any(map(_has_non_finite, obj))
+    if isinstance(obj, dict):
+        return any(map(_has_non_finite, obj.values()))
+    return False
+
+def _import_optional(name):
+    """import a module, returning None if it is not installed"""
+    try:
+        return importlib.import_module(name)
+    except ImportError:
+        return None
+
+def set_json_backend(backend=None, strict=None):
+    """select the json library used to read and write jmt files.
+
+    the defaults are taken from the JMT_JSON_BACKEND environment variable
+    (auto, orjson, ujson or json) and JMT_JSON_STRICT (set it to 0 to let
+    the faster library also write the files, with a compact format).
+    """
+    global _codec
+    if backend is None:
+        backend = os.environ.get("JMT_JSON_BACKEND", "auto")
+    if strict is None:
+        strict = os.environ.get("JMT_JSON_STRICT", "1") != "0"
+    _codec = JSONCodec(backend, strict)
+    return _codec
+
+_codec = set_json_backend()
+
+# %% reading and writing compressed files
+
+# maximum uncompressed size of a block, so that the compressed one fits
+# in the 64 KiB that a block gzip header can describe
+BLOCK_GZIP_SIZE = 0xff00
+
+_MAGIC_NUMBERS = [
+    (b"\x1f\x8b", "gzip"),
+    (b"BZh", "bz2"),
+    (b"\xfd7zXZ\x00", "lzma"),
+    ]
+
+def _compression_of(filename):
+    """compression of a file from its first bytes: gzip, bz2, lzma or None"""
+    with open(filename, "rb") as stream:
+        start = stream.read(6)
+    for magic, compression in _MAGIC_NUMBERS:
+        if start.startswith(magic):
+            return compression
+    return None
+
+def _open_binary_input(filename):
+    """open a file for reading, decompressing it if it is compressed"""
+    stream = open(filename, "rb")
+    start = stream.peek(6)[:6]
+    for magic, compression in _MAGIC_NUMBERS:
+        if start.startswith(magic):
+            # opened by name, so that closing it closes the file too
+            stream.close()
+            module = importlib.import_module(compression)
+            return module.open(filename, "rb")
+    return stream
+
+def _open_binary_output(filename, buffer_size=io.DEFAULT_BUFFER_SIZE):
+    """open a file for writing, compressing it according to the extension.
+
+    .gz files are written in blocks (see `BlockGzipWriter`), that can be
+    read by any gzip reader but also allow random access with an index.
+    .bz2 and .xz (or .lzma) files use the standard library modules.
+    """
+    if filename.endswith(".gz"):
+        return BlockGzipWriter(filename)
+    if filename.endswith(".bz2"):
+        import bz2
+        return bz2.open(filename, "wb")
+    if filename.endswith((".xz", ".lzma")):
+        import lzma
+        return lzma.open(filename, "wb")
+    return open(filename, "wb", buffering=buffer_size)
+
+class BlockGzipWriter:
+    """write a gzip file as a series of independently compressed blocks.
+
+    The layout is the same as BGZF: each block is a complete gzip member
+    of at most 64 KiB, with its compressed size stored in an extra field
+    of the header, and the file ends with an empty block.
+    The blocks end on a newline whenever the line fits in a block, so
+    each block can be decompressed and parsed on its own.
+    """
+    def __init__(self, filename, level=6, block_size=BLOCK_GZIP_SIZE):
+        self.level = level
+        self.block_size = block_size
+        self._file = open(filename, "wb")
+        self._buffer = bytearray()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, data: bytes) -> int:
+        self._buffer += data
+        while len(self._buffer) >= self.block_size:
+            cut = self._buffer.rfind(b"\n", 0, self.block_size) + 1
+            # a line longer than a block has to be split
+            cut = cut or self.block_size
+            self._write_block(bytes(self._buffer[:cut]))
+            del self._buffer[:cut]
+        return len(data)
+
+    def writelines(self, lines: Iterable[bytes]):
+        for line in lines:
+            self.write(line)
+
+    def _write_block(self, data: bytes):
+        compressor = zlib.compressobj(self.level, zlib.DEFLATED, -15)
+        deflated = compressor.compress(data) + compressor.flush()
+        # the header is 18 bytes and the trailer 8, minus one by convention
+        block_size = len(deflated) + 25
+        header = struct.pack(
+            "<4BI2BH2BHH",
+            0x1f, 0x8b, 8, 4, 0, 0, 255, 6, ord("B"), ord("C"), 2, block_size,
+            )
+        trailer = struct.pack("<II", zlib.crc32(data), len(data))
+        self._file.write(header + deflated + trailer)
+
+    def flush(self):
+        self._file.flush()
+
+    def close(self):
+        if self._file.closed:
+            return
+        if self._buffer:
+            self._write_block(bytes(self._buffer))
+            self._buffer.clear()
+        # empty block marking the end of the file
+        self._write_block(b"")
+        self._file.close()
+
+class BlockGzipReader:
+    """random access to the uncompressed bytes of a block gzip file.
+
+    blocks is the list of [compressed offset, uncompressed offset] of each
+    block, followed by the sizes of the file; it is read from the block
+    headers if not given (for example by the index).
+    """
+    def __init__(self, filename, blocks=None, workers=None):
+        self.filename = filename
+        self.blocks = blocks if blocks is not None else self.scan_blocks(filename)
+        self.workers = workers
+        self._uncompressed = [block[1] for block in self.blocks]
+        self._file = open(filename, "rb")
+
+    @staticmethod
+    def is_block_gzip(filename) -> bool:
+        with open(filename, "rb") as stream:
+            header = stream.read(18)
+        return len(header) == 18 and header[:4] == b"\x1f\x8b\x08\x04" and header[12:14] == b"BC"
+
+    @staticmethod
+    def scan_blocks(filename) -> Iterable[Tuple[int, int]]:
+        """offsets of the blocks, reading only their headers and trailers"""
+        blocks = []
+        compressed, uncompressed = 0, 0
+        with open(filename, "rb") as stream:
+            while True:
+                header = stream.read(18)
+                if not header:
+                    break
+                if header[:4] != b"\x1f\x8b\x08\x04" or header[12:14] != b"BC":
+                    raise ValueError("not a block gzip file: {}".format(filename))
+                block_size = struct.unpack("<H", header[16:18])[0] + 1
+                stream.seek(compressed + block_size - 4)
+                size = struct.unpack("<I", stream.read(4))[0]
+                blocks.append([compressed, uncompressed])
+                compressed += block_size
+                uncompressed += size
+        blocks.append([compressed, uncompressed])
+        return blocks
+
+    @staticmethod
+    def _inflate(block: bytes) -> bytes:
+        # skip the header (with its extra fields) and the trailer
+        extra = struct.unpack("<H", block[10:12])[0]
+        return zlib.decompress(block[12 + extra:-8], -15)
+
+    def read(self, start, stop) -> bytes:
+        """uncompressed bytes from start to stop, decompressing their blocks"""
+        first = max(bisect.bisect_right(self._uncompressed, start) - 1, 0)
+        last = bisect.bisect_left(self._uncompressed, stop)
+        last = min(max(last, first + 1), len(self.blocks) - 1)
+        offsets = [block[0] for block in self.blocks[first:last + 1]]
+        self._file.seek(offsets[0])
+        raw = self._file.read(offsets[-1] - offsets[0])
+        bounds = [offset - offsets[0] for offset in offsets]
+        pieces = [raw[a:b] for a, b in zip(bounds[:-1], bounds[1:])]
+        if len(pieces) > 1 and self.workers != 1:
+            # zlib releases the GIL, so the blocks decompress in parallel
+            from concurrent.futures import ThreadPoolExecutor
+            with ThreadPoolExecutor(self.workers) as pool:
+                data = b"".join(pool.map(self._inflate, pieces))
+        else:
+            data = b"".join(map(self._inflate, pieces))
+        base = self.blocks[first][1]
+        return data[start - base:stop - base]
+
+    def close(self):
+        self._file.close()
+
+class _MappedRanges:
+    """byte ranges of a plain file, from a memory map"""
+    def __init__(self, filename):
+        with open(filename, "rb") as stream:
+            self._map = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+
+    def read(self, start, stop) -> bytes:
+        return self._map[start:stop]
+
+    def close(self):
+        self._map.close()
+
+class _StreamRanges:
+    """byte ranges of a compressed file, decompressing it up to them"""
+    def __init__(self, filename):
+        self.filename = filename
+
+    def read(self, start, stop) -> bytes:
+        with _open_binary_input(self.filename) as stream:
+            stream.seek(start)
+            return stream.read(stop - start)
+
+    def close(self):
+        pass
+
+def _open_ranges(filename, index=None):
+    """object to read ranges of uncompressed bytes of a file with `read`"""
+    if index is not None and index.blocks is not None:
+        return BlockGzipReader(filename, index.blocks)
+    compression = _compression_of(filename)
+    if compression is None:
+        return _MappedRanges(filename)
+    if compression == "gzip" and BlockGzipReader.is_block_gzip(filename):
+        return BlockGzipReader(filename)
+    return _StreamRanges(filename)
+
+@contextlib.contextmanager
+def _open_input(source):
+    """binary stream to read a file, stdin if the source is None or "-".
+
+    compressed files are decompressed transparently.
+    an open stream is used as it is, and not closed at the end
+    """
+    if source is None or source == "-":
+        yield sys.stdin.buffer
+    elif hasattr(source, "read"):
+        yield source
+    else:
+        with _open_binary_input(source) as stream:
+            yield stream
+
+@contextlib.contextmanager
+def _open_output(dest):
+    """binary stream to write a file, stdout if dest is None or "-".
+
+    the file is compressed according to its extension
+    """
+    if dest is None or dest == "-":
+        yield sys.stdout.buffer
+        sys.stdout.buffer.flush()
+    elif hasattr(dest, "write"):
+        yield dest
+    else:
+        with _open_binary_output(dest) as stream:
+            yield stream
 
 # %% define the minimum structures
 
@@ -52,6 +416,13 @@ class Table:
         """is truthy if contains values"""
         return len(self.data)!=0
     
+    def __len__(self):
+        return len(self.data)
+    
+    def __getitem__(self, key):
+        """return a row, or a list of rows if the key is a slice"""
+        return self.data[key]
+    
     def __eq__(self, other):
         if not isinstance(other, self.__class__):
             return False
@@ -59,11 +430,349 @@ class Table:
         same_data = self.data == other.data
         return (same_info and same_data)
 
+    def close(self):
+        """release the resources of the data, like the file of `open_table`"""
+        close = getattr(self.data, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
     def as_pandas(self):
         """convert to a pandas dataframe, the header is used as parameters"""
+        import pandas as pd
         df = pd.DataFrame(self.data, columns=self.info['columns'])
         return df
     
+    def to_columnar(self):
+        """convert to a table that stores the data by column"""
+        return ColumnarTable.from_rows(self.info, self.data)
+    
+
+# names accepted for the column types, in a `types` table or header key
+COLUMN_TYPES = {
+    "int64": "int64", "int": "int64", "integer": "int64",
+    "float64": "float64", "float": "float64", "number": "float64",
+    "bool": "bool", "boolean": "bool",
+    "category": "category", "categorical": "category",
+    "string": "string", "str": "string", "text": "string",
+    "object": "object", "any": "object",
+    }
+
+# array typecode and python types of the values allowed in each type
+_TYPE_STORAGE = {
+    "int64": ("q", {int}),
+    "float64": ("d", {int, float}),
+    "bool": ("?", {bool}),
+    "string": (None, {str, type(None)}),
+    "object": (None, None),
+    }
+
+def _infer_type(values: list) -> str:
+    """the most compact column type that can hold the values exactly"""
+    kinds = set(map(type, values))
+    if kinds and kinds <= {bool}:
+        return "bool"
+    elif kinds and kinds <= {int}:
+        in_range = -2**63 <= min(values) and max(values) < 2**63
+        return "int64" if in_range else "object"
+    elif kinds and kinds <= {int, float}:
+        # integers bigger than this would lose precision as floats
+        exact = all(abs(v) <= 2**53 for v in values if type(v) is int)
+        return "float64" if exact else "object"
+    return "object"
+
+def _typed_column(values: list, column_type: str):
+    """store a list of values in an array of the given type.
+
+    uses numpy if installed (bool, int64, float64 or object arrays),
+    otherwise array.array for int and float columns and plain lists.
+    category columns are stored as `Categorical`.
+    raise ValueError if a value does not fit the type.
+    """
+    column_type = _canonical_type(column_type)
+    if column_type == "category":
+        return Categorical.from_values(values)
+    typecode, allowed = _TYPE_STORAGE[column_type]
+    if allowed is not None:
+        wrong = set(map(type, values)) - allowed
+        if typecode == "q" and not wrong and values:
+            wrong = set() if -2**63 <= min(values) and max(values) < 2**63 else {int}
+        if wrong:
+            message = "values of type {} in a column of type {}"
+            names = ", ".join(sorted(kind.__name__ for kind in wrong))
+            raise ValueError(message.format(names, column_type))
+    np = _import_optional("numpy")
+    if np is not None:
+        if typecode is None:
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            return column
+        return np.array(values, dtype=typecode)
+    if typecode is None or typecode == "?":
+        return list(values)
+    return array.array(typecode, values)
+
+def _canonical_type(column_type: str) -> str:
+    """the name of a column type in `COLUMN_TYPES`, or ValueError"""
+    try:
+        return COLUMN_TYPES[column_type]
+    except (KeyError, TypeError):
+        raise ValueError("unknown column type: {!r}".format(column_type))
+
+def _declared_column(values: list, column_type: str):
+    """store the values of a column with a declared type, allowing nulls.
+
+    the nulls of float64 columns become NaN, while int64 and bool columns
+    with nulls are stored as objects: return the column and the reason of
+    this fallback, None if the type is respected.
+    """
+    column_type = _canonical_type(column_type)
+    if column_type in ("int64", "bool", "float64") and None in values:
+        if column_type == "float64":
+            values = [float("nan") if v is None else v for v in values]
+        else:
+            # the other values must still be of the declared type
+            _typed_column([v for v in values if v is not None], column_type)
+            reason = "null values in a column of type {}".format(column_type)
+            return _typed_column(values, "object"), reason
+    return _typed_column(values, column_type), None
+
+def _aligned_types(types, columns) -> List[Optional[str]]:
+    """the type of each column, from a list or a mapping by column name"""
+    if isinstance(types, abcMapping):
+        return [types.get(column) for column in columns]
+    types = list(types)
+    if len(types) != len(columns):
+        message = "{} types declared for {} columns"
+        raise ValueError(message.format(len(types), len(columns)))
+    return types
+
+def _column_array(values: list):
+    """store a list of values in the most compact array that can hold them"""
+    return _typed_column(values, _infer_type(values))
+
+def _column_type(column) -> str:
+    """type of the values stored in a column"""
+    if isinstance(column, Categorical):
+        return "category"
+    typecode = getattr(column, "typecode", None)
+    if typecode is None:
+        dtype = getattr(column, "dtype", None)
+        typecode = getattr(dtype, "char", None)
+    return {"q": "int64", "d": "float64", "?": "bool"}.get(typecode, "object")
+
+def _declared_types(info, declared=None) -> Optional[List[Optional[str]]]:
+    """the type of each column, from the `types` key of the header or the
+    types declared in a `types` table, None for the columns without one.
+
+    the `types` key can be a list aligned with the columns or a mapping
+    from the column names.
+    """
+    types = info.get("types")
+    if types is None:
+        types = (declared or {}).get(info["name"])
+    if types is None:
+        return None
+    return _aligned_types(types, info["columns"])
+
+def _types_from_table(table) -> Mapping[str, Mapping[str, str]]:
+    """the types of a `types` table, with the table, column and type"""
+    declared = {}
+    for name, column, column_type in table.data:
+        declared.setdefault(name, {})[column] = column_type
+    return declared
+
+class Categorical:
+    """column with few distinct values, stored as integer codes that refer
+    to a list of categories. None is stored with the code -1.
+    """
+    def __init__(self, codes, categories: list):
+        self.codes = codes
+        self.categories = categories
+
+    @classmethod
+    def from_values(cls, values: list):
+        positions = {}
+        codes = [
+            -1 if value is None else positions.setdefault(value, len(positions))
+            for value in values
+            ]
+        np = _import_optional("numpy")
+        if np is not None:
+            codes = np.array(codes, dtype="i")
+        else:
+            codes = array.array("i", codes)
+        return cls(codes, list(positions))
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            return self.__class__(self.codes[key], self.categories)
+        code = self.codes[key]
+        return None if code == -1 else self.categories[code]
+
+    def tolist(self) -> list:
+        categories = self.categories + [None]
+        return [categories[code] for code in self.codes]
+
+    def __array__(self, dtype=None, copy=None):
+        import numpy as np
+        column = np.empty(len(self), dtype=object)
+        column[:] = self.tolist()
+        return column if dtype is None else column.astype(dtype)
+
+    def __eq__(self, other):
+        if not isinstance(other, Categorical):
+            return NotImplemented
+        return self.tolist() == other.tolist()
+
+    def __repr__(self) -> str:
+        return "{}(codes={}, categories={})".format(
+            self.__class__.__qualname__,
+            self.codes,
+            self.categories,
+            )
+
+def _column_values(column) -> list:
+    """python values of a column, whatever the storage"""
+    return column.tolist() if hasattr(column, "tolist") else list(column)
+
+class ColumnarTable(Table):
+    """table that stores its data by column instead of by row.
+
+    each column is kept in a compact typed array (see `_typed_column`),
+    so numeric columns take 8 bytes per value instead of a python object.
+    The types are the ones declared in the `types` key of the header (or
+    passed explicitly), and are inferred from the values for the others.
+    The nulls of declared float64 columns are stored as NaN, the declared
+    int64 and bool columns with nulls are stored as objects, and the reason
+    is kept in `fallbacks`, by column name.
+    `data` is still available, but it is rebuilt from the columns.
+    """
+    def __init__(self, 
+            info: Mapping[str, Any], 
+            columns_data: Iterable,
+            fallbacks: Optional[Mapping[str, str]] = None,
+            ):
+        self.info = info
+        self.columns_data = list(columns_data)
+        self.fallbacks = dict(fallbacks or {})
+        self._columns_name = "columns"
+        self._name_name = "name"
+        assert len(self.columns_data) == len(self.columns)
+
+    @classmethod
+    def from_rows(cls, info, rows: Iterable[Iterable], types=None):
+        """build the columns consuming the rows in a single pass.
+
+        types is a list or a mapping of the type of each column, see
+        `COLUMN_TYPES`, by default the ones declared in the header.
+        ValueError is raised if a row doesn't have one value per column.
+        """
+        values = [[] for _ in info["columns"]]
+        appends = [column.append for column in values]
+        for number, row in enumerate(rows):
+            if len(row) != len(appends):
+                message = "row {}: {} values for {} columns"
+                raise ValueError(message.format(number, len(row), len(appends)))
+            for append, value in zip(appends, row):
+                append(value)
+        if types is None:
+            types = _declared_types(info)
+        else:
+            types = _aligned_types(types, info["columns"])
+        if types is None:
+            return cls(info, map(_column_array, values))
+        return cls._with_types(info, values, types)
+
+    @classmethod
+    def _with_types(cls, info, values, types):
+        columns, fallbacks = [], {}
+        for name, column, column_type in zip(info["columns"], values, types):
+            if column_type is None:
+                columns.append(_column_array(column))
+                continue
+            column, reason = _declared_column(column, column_type)
+            columns.append(column)
+            if reason is not None:
+                fallbacks[name] = reason
+        return cls(info, columns, fallbacks)
+
+    @property
+    def types(self) -> List[str]:
+        """the type of each column, as stored"""
+        return list(map(_column_type, self.columns_data))
+
+    def astype(self, types):
+        """convert the columns to the given types (a list or a mapping)"""
+        types = _aligned_types(types, self.columns)
+        columns, fallbacks = [], dict(self.fallbacks)
+        for name, column, column_type in zip(self.columns, self.columns_data, types):
+            if column_type is not None:
+                fallbacks.pop(name, None)
+                column, reason = _declared_column(_column_values(column), column_type)
+                if reason is not None:
+                    fallbacks[name] = reason
+            columns.append(column)
+        return self.__class__(self.info, columns, fallbacks)
+
+    @property
+    def data(self) -> Iterable[list]:
+        columns = map(_column_values, self.columns_data)
+        return list(map(list, zip(*columns)))
+
+    def __repr__(self) -> str:
+        return "{}(info={}, columns_data={})".format(
+            self.__class__.__qualname__, 
+            self.info, 
+            self.columns_data,
+            )
+    
+    def __len__(self):
+        return len(self.columns_data[0]) if self.columns_data else 0
+
+    def __bool__(self):
+        return len(self) != 0
+    
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            columns = [_column_values(c[key]) for c in self.columns_data]
+            return list(map(list, zip(*columns)))
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("row index out of range")
+        return [_column_values(c[key:key+1])[0] for c in self.columns_data]
+
+    def __eq__(self, other):
+        if not isinstance(other, Table):
+            return False
+        return self.info == other.info and self.data == other.data
+
+    def to_rows(self) -> Table:
+        """convert back to a table that stores the data by row"""
+        return Table(info=self.info, data=self.data)
+
+    def as_pandas(self):
+        """convert to a pandas dataframe using the columns as they are"""
+        import numpy as np
+        import pandas as pd
+        def as_array(column):
+            if isinstance(column, Categorical):
+                return pd.Categorical.from_codes(column.codes, column.categories)
+            return np.asarray(column)
+        arrays = {idx: as_array(c) for idx, c in enumerate(self.columns_data)}
+        df = pd.DataFrame(arrays, copy=False)
+        df.columns = self.columns
+        return df
+    
     
 class DataBase:
     def __init__(self,
@@ -71,6 +780,9 @@ class DataBase:
             ):
         
         self.tables = tables
+        # a lazy mapping checks the names when it loads the tables
+        if isinstance(tables, LazyTables):
+            return
         for name, table in self.tables.items():
             assert name == table.name
     
@@ -91,130 +803,1620 @@ class DataBase:
             return False
         result = all( self.tables[key]==other.tables[key] for key in self.names )
         return result
-    
-    def as_pandas(self) -> Iterable:
-        tables = [tab.as_pandas() for tab in self.tables]
+    
+    def headers(self) -> Mapping[str, Mapping[str, Any]]:
+        """the header of each table, without loading the lazy tables"""
+        if isinstance(self.tables, LazyTables):
+            return {name: self.tables.header(name) for name in self.tables}
+        return {name: table.info for name, table in self.tables.items()}
+    
+    def as_pandas(self) -> Mapping:
+        return {name: tab.as_pandas() for name, tab in self.tables.items()}
+
+# %% stream parsing of the jmt lines
+
+class LocationData(NamedTuple):
+    """Simple class to store the start and end of a line in a byte data source.
+
+    it will be used to generate index for fast access.
+    """
+    start: int
+    end: int
+    data: Union[dict, list]
+    # the line as it was read, to copy it without encoding it again
+    raw: bytes = b""
+
+TableType = Iterable[Tuple[LocationData, Iterable[LocationData]]]
+
+def parse_file(byte_stream: Iterable[bytes]) -> Iterable[LocationData]:
+    """parse a sequence of byte lines in an iterable of line location and data
+
+    only objects and arrays are returned, the empty lines and the other
+    json values are skipped (but still counted in the byte offsets)
+    """
+    start = 0
+    for byte_line in byte_stream:
+        end = start + len(byte_line)
+        line = byte_line.strip()
+        struct = _codec.loads(line) if line else None
+        if isinstance(struct, (dict, list)):
+            yield LocationData(start, end, struct, byte_line)
+        start = end
+
+def scan_file(byte_stream: Iterable[bytes]) -> Iterable[LocationData]:
+    """like `parse_file`, but only the headers are decoded.
+
+    the lines are classified by their first non blank byte: `{` for the
+    headers and `[` for the rows, any other line is skipped.
+    The rows are returned with None as data, and can be decoded later from
+    their raw bytes (see `_decode_raw`) or copied as they are.
+    """
+    start = 0
+    for byte_line in byte_stream:
+        end = start + len(byte_line)
+        first = byte_line.lstrip()[:1]
+        if first == b"[":
+            yield LocationData(start, end, None, byte_line)
+        elif first == b"{":
+            yield LocationData(start, end, _codec.loads(byte_line), byte_line)
+        start = end
+
+def _decode_raw(line: LocationData) -> list:
+    """decode a row returned by `scan_file`"""
+    return _codec.loads(line.raw)
+
+def group(structs: Iterable[LocationData]) -> TableType:
+    """take a sequence of line data and group them in tables
+
+    the lines are objects and arrays, from `parse_file` or `scan_file`:
+    objects are the headers and everything else is a row.
+    each header is returned together with a lazy iterator over its rows,
+    that is valid only until the next table is requested.
+    """
+    is_header = lambda obj: isinstance(obj.data, dict)
+    # remove the rows that are at the beginning
+    good_structs = it.dropwhile(lambda obj: not is_header(obj), structs)
+    # group together all the headers and all the rows
+    grouped = it.groupby(good_structs, is_header)
+    # pair the header and the data and return them in pairs
+    header = LocationData(-1, -1, {})
+    for kind_is_header, seq in grouped:
+        # don't need to initialize the header,
+        # I've dropped all the rows before the first header
+        if kind_is_header:
+            # get the last element,
+            # i.e. drop all the header with no data that follow them
+            *_, header = seq
+        else:
+            yield header, seq
+
+def _iter_rows_at(filename, start) -> Iterable[list]:
+    """decode the rows of the table starting at the given offset"""
+    with _open_input(filename) as stream:
+        stream.seek(start)
+        lines = scan_file(stream)
+        rows = it.takewhile(lambda line: line.data is None, lines)
+        yield from map(_decode_raw, rows)
+
+class LazyTables(abcMapping):
+    """mapping of the tables of a jmt file, each one is loaded when accessed
+
+    the first access scans the file to find where each table starts,
+    then only the rows of the requested table are parsed.
+    Loaded tables are kept, so each table is read at most once.
+    with arrays=True the array columns are decoded, see `_decode_arrays`.
+    """
+    def __init__(self, filename, index=None, arrays=False):
+        self.filename = filename
+        self.index = index
+        self.arrays = arrays
+        self._locations = None
+        self._loaded = {}
+
+    def _scan(self) -> Mapping[str, Tuple[dict, int]]:
+        if self._locations is None and self.index is not None:
+            self._locations = {
+                name: (self.index.headers[name], location.data_start)
+                for name, location in self.index.tables.items()
+                }
+        if self._locations is None:
+            locations = {}
+            with _open_input(self.filename) as stream:
+                for header, rows in group(scan_file(stream)):
+                    first_row = next(rows)
+                    name = header.data['name']
+                    locations[name] = (header.data, first_row.start)
+            self._locations = locations
+        return self._locations
+
+    def header(self, name) -> Mapping[str, Any]:
+        """return the header of a table without loading its rows"""
+        info, _ = self._scan()[name]
+        return info
+
+    def iter_rows(self, name) -> Iterable[list]:
+        """stream the rows of a table from the file, without keeping them"""
+        _, start = self._scan()[name]
+        yield from _iter_rows_at(self.filename, start)
+
+    def __getitem__(self, name) -> Table:
+        if name not in self._loaded:
+            table = Table(info=self.header(name), data=list(self.iter_rows(name)))
+            assert name == table.name
+            if self.arrays:
+                table = _decode_arrays(table)
+            self._loaded[name] = table
+        return self._loaded[name]
+
+    def __iter__(self):
+        return iter(self._scan())
+
+    def __len__(self):
+        return len(self._scan())
+
+    def __repr__(self) -> str:
+        return "{}(filename={!r})".format(
+            self.__class__.__qualname__,
+            self.filename,
+            )
+
+# %%
+
+def _sqlite_affinity(values: Iterable) -> str:
+    """sqlite column type that fits the values, empty for no affinity"""
+    kinds = set(map(type, values)) - {type(None)}
+    if not kinds:
+        return ""
+    for affinity, types in _SQLITE_AFFINITIES:
+        if kinds <= types:
+            return affinity
+    return ""
+
+_SQLITE_AFFINITIES = [
+    ("INTEGER", {bool, int}),
+    ("REAL", {bool, int, float}),
+    ("TEXT", {str}),
+    ("BLOB", {bytes}),
+    ]
+
+# sqlite column type of each of the `COLUMN_TYPES`
+_SQLITE_TYPES = {
+    "int64": "INTEGER",
+    "float64": "REAL",
+    "bool": "INTEGER",
+    "category": "TEXT",
+    "string": "TEXT",
+    "object": "",
+    }
+
+def _tune_for_bulk_load(connection):
+    """trade durability during the load for speed, as it can be repeated"""
+    connection.execute("PRAGMA synchronous=OFF")
+    connection.execute("PRAGMA journal_mode=MEMORY")
+
+def write_table_into_sql_connection(
+        connection, info, rows, if_exists="fail", chunk_size=50000,
+        ):
+    """write the rows of a table in a sqlite connection, without pandas.
+
+    the column types are the ones declared in the `types` key of the
+    header, or are inferred from the first chunk of rows, and the
+    rows are inserted with executemany, with a transaction for each chunk
+    of `chunk_size` rows, so the rows can be a stream of any length.
+    If the connection is already in a transaction, it is left to the
+    caller to commit it.
+    Arrays and objects in the cells are stored as json strings.
+    if_exists can be 'fail', 'replace' or 'append', as in pandas.
+    """
+    name = _quote_identifier(info["name"])
+    columns = info["columns"]
+    if not columns:
+        return
+    rows = iter(rows)
+    chunk = list(it.islice(rows, chunk_size))
+    values = list(zip(*chunk)) or [()] * len(columns)
+    affinities = list(map(_sqlite_affinity, values))
+    for idx, column_type in enumerate(_declared_types(info) or []):
+        if column_type is not None:
+            affinities[idx] = _SQLITE_TYPES[_canonical_type(column_type)]
+    definitions = ", ".join(
+        " ".join(filter(None, [_quote_identifier(column), affinity]))
+        for column, affinity in zip(columns, affinities)
+        )
+    is_struct = lambda value: isinstance(value, (list, dict))
+    if if_exists == "replace":
+        connection.execute("DROP TABLE IF EXISTS {}".format(name))
+    create = "CREATE TABLE {}{} ({})".format(
+        "IF NOT EXISTS " if if_exists == "append" else "",
+        name,
+        definitions,
+        )
+    connection.execute(create)
+    insert = "INSERT INTO {} VALUES ({})".format(
+        name,
+        ", ".join("?" * len(columns)),
+        )
+    def encode(chunk):
+        # the columns with structured values are checked on each chunk,
+        # before inserting it, as they can appear in any row
+        # the types are collected at C speed, first on the whole chunk,
+        # and only if there are structured values on each column
+        structs = (list, dict)
+        if set(map(type, it.chain.from_iterable(chunk))).isdisjoint(structs):
+            return chunk
+        json_columns = [
+            idx for idx in range(len(columns))
+            if not set(map(type, map(op.itemgetter(idx), chunk))).isdisjoint(structs)
+            ]
+        chunk = [list(row) for row in chunk]
+        for row in chunk:
+            for idx in json_columns:
+                if is_struct(row[idx]):
+                    row[idx] = _codec.dumps(row[idx])
+        return chunk
+    own_transactions = not connection.in_transaction
+    while chunk:
+        if own_transactions:
+            with connection:
+                connection.executemany(insert, encode(chunk))
+        else:
+            connection.executemany(insert, encode(chunk))
+        chunk = list(it.islice(rows, chunk_size))
+
+def write_into_sql_connection(database, connection, names=None):
+    """write the tables in the connection, by default all of them"""
+    names = database.names if names is None else names
+    for name in names:
+        table = database.tables[name]
+        write_table_into_sql_connection(connection, table.info, table.data)
+        
+def write_into_sqlite(database, filename):
+    with closing(connect(filename)) as connection:
+        _tune_for_bulk_load(connection)
+        write_into_sql_connection(database, connection)
+
+# maximum number of rows in an excel sheet, header included
+EXCEL_MAX_ROWS = 1048576
+
+def _excel_sheet_name(name, part):
+    """name of the sheet of a part of a table, the first keeps the name"""
+    if part == 1:
+        return name
+    suffix = "~{}".format(part)
+    return name[:31 - len(suffix)] + suffix
+
+def _excel_sheet_groups(sheetnames) -> Iterable[Tuple[str, list]]:
+    """group the continuation sheets of a table together with the first"""
+    groups = []
+    for sheetname in sheetnames:
+        if groups:
+            name, parts = groups[-1]
+            if sheetname == _excel_sheet_name(name, len(parts) + 1):
+                parts.append(sheetname)
+                continue
+        groups.append((sheetname, [sheetname]))
+    return groups
+
+def _append_table_to_workbook(workbook, table, max_rows=EXCEL_MAX_ROWS):
+    """write the table in new sheets, continuing in more if too long"""
+    rows = iter(table.data)
+    part = 1
+    while True:
+        worksheet = workbook.create_sheet(_excel_sheet_name(table.name, part))
+        worksheet.append(table.columns)
+        for line in it.islice(rows, max_rows - 1):
+            worksheet.append(line)
+        following = next(rows, None)
+        if following is None:
+            break
+        rows = it.chain([following], rows)
+        part += 1
+
+def write_tables_into_excel(tables, filename, max_rows=EXCEL_MAX_ROWS):
+    """write a sequence of tables in an excel file, one sheet for each.
+
+    a new file is written in write-only mode, streaming the rows.
+    If the file exists it is updated instead, replacing the sheets of the
+    tables with the same name and keeping the others as they are.
+    Tables longer than max_rows continue in sheets named `name~2`, ...
+    """
+    from openpyxl import load_workbook, Workbook
+    try:
+        workbook = load_workbook(filename)
+    except FileNotFoundError:    
+        workbook = Workbook(write_only=True) 
+    for table in tables:
+        if not workbook.write_only:
+            for name, sheetnames in _excel_sheet_groups(workbook.sheetnames):
+                if name == table.name:
+                    for sheetname in sheetnames:
+                        del workbook[sheetname]
+        _append_table_to_workbook(workbook, table, max_rows)
+    workbook.save(filename)
+
+def write_into_excel(database, filename):
+    write_tables_into_excel(database.tables.values(), filename)
+
+class JMTWriter:
+    """write a jmt file incrementally, one table and one batch at a time.
+
+    with JMTWriter("data.jtm") as writer:
+        writer.begin_table({"name": "ages", "columns": ["name", "age"]})
+        writer.append_rows(rows)
+
+    the rows are encoded in batches of `batch_size` and written as a single
+    block, through a buffer of `buffer_size` bytes.
+    It accepts a filename or an already open stream (text or binary),
+    that is not closed at the end. Files ending in .gz, .bz2 or .xz are
+    compressed (see `_open_binary_output`).
+    """
+    def __init__(self, file, batch_size=4096, buffer_size=2**20):
+        self.batch_size = batch_size
+        self._in_table = False
+        self._close = not hasattr(file, "write")
+        if self._close:
+            self._stream = _open_binary_output(file, buffer_size)
+        else:
+            self._stream = file
+        self._binary = not isinstance(self._stream, io.TextIOBase)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _write(self, text: str):
+        self._stream.write(text.encode("utf8") if self._binary else text)
+
+    def begin_table(self, info: Mapping[str, Any]):
+        """start a new table, the following rows will belong to it"""
+        self._write(_codec.dumps(info) + "\n")
+        self._in_table = True
+
+    def append_rows(self, rows: Iterable[Iterable]):
+        """write the rows of the current table, encoding them in batches"""
+        if not self._in_table:
+            raise ValueError("rows can't be written before a table header")
+        dumps = _codec.dumps
+        rows = iter(rows)
+        while True:
+            batch = list(map(dumps, it.islice(rows, self.batch_size)))
+            if not batch:
+                break
+            batch.append("")
+            self._write("\n".join(batch))
+
+    def append_raw(self, data: bytes):
+        """write rows already encoded as json lines, ending with a newline"""
+        if not self._in_table:
+            raise ValueError("rows can't be written before a table header")
+        self._stream.write(data if self._binary else data.decode("utf8"))
+
+    def write_table(self, table: Table):
+        self.begin_table(table.info)
+        self.append_rows(table.data)
+
+    def flush(self):
+        self._stream.flush()
+
+    def close(self):
+        if self._close:
+            self._stream.close()
+        else:
+            self._stream.flush()
+
+def write_into_jsontable(database, filename):
+    with JMTWriter(filename) as writer:
+        for name, table in database.tables.items():
+            writer.write_table(table)
+
+def query(database, query, db=":memory:"):
+    """return a list of dictionary with the right column names.
+    
+    It could be converted in a jsontable afterward.
+    Only the tables used by the query are loaded in the database.
+    """
+    names = referenced_tables(query, database.headers())
+    with closing(connect(db)) as connection:
+        write_into_sql_connection(database, connection, names)
+        result = _run_query(connection, query)
+    return result 
+
+def _quote_identifier(name: str) -> str:
+    return '"{}"'.format(name.replace('"', '""'))
+
+def referenced_tables(query, headers: Mapping[str, Mapping]):
+    """names of the tables read by the query, None if it can't be found.
+
+    the query is compiled against empty tables with the same columns,
+    and the sqlite authorizer reports which tables it reads.
+    """
+    tables = set()
+    def authorizer(action, table, column, database, trigger):
+        if action == sqlite3.SQLITE_READ and table is not None:
+            tables.add(table)
+        return sqlite3.SQLITE_OK
+    with closing(connect(":memory:")) as connection:
+        try:
+            for name, info in headers.items():
+                columns = ", ".join(map(_quote_identifier, info["columns"]))
+                create = "CREATE TABLE {} ({})"
+                connection.execute(create.format(_quote_identifier(name), columns))
+            connection.set_authorizer(authorizer)
+            connection.execute("EXPLAIN " + query).fetchall()
+        except sqlite3.Error:
+            return None
+    return [name for name in headers if name in tables]
+
+def _run_query(connection, query):
+    """execute the query, returning the rows as dictionaries"""
+    def dict_from_row(row):
+        return dict(zip(row.keys(), row))  
+    connection.row_factory = Row
+    cursor = connection.cursor()
+    cursor.execute(query)
+    rows = cursor.fetchall()
+    result = [dict_from_row(row) for row in rows]
+    return result 
+
+# %% persistent cache of the sqlite image of the jmt files
+
+def _cache_dir():
+    """directory of the jmt caches, from $JMT_CACHE_DIR or ~/.cache/jmt"""
+    default = os.path.join(os.path.expanduser("~"), ".cache", "jmt")
+    return os.environ.get("JMT_CACHE_DIR") or default
+
+def file_hash(filename, block_size=2**20) -> str:
+    """hash of the content of a file"""
+    digest = hashlib.blake2b(digest_size=20)
+    with open(filename, "rb") as stream:
+        for block in iter(partial(stream.read, block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+def cached_sqlite(filename, cache_dir=None, query=None) -> str:
+    """return the path of a sqlite database with the tables of a jmt file.
+
+    the database is kept in the cache directory and it is rebuilt only when
+    the source changes: it is reused as long as the size and the
+    modification time of the source match, or, when only the modification
+    time differs, if the content hash is the same.
+    The tables are added to the database the first time they are needed:
+    if a query is given only the tables it reads are loaded.
+    """
+    db_path, connection = _open_cached_sqlite(filename, cache_dir, query)
+    connection.close()
+    return db_path
+
+# seconds to wait for the tables being loaded by another process
+SQLITE_CACHE_TIMEOUT = 3600
+
+def _open_cached_sqlite(filename, cache_dir=None, query=None):
+    """the path of the cached database and a connection to it, with the
+    tables needed by the query loaded, see `cached_sqlite`.
+
+    the missing tables are written in a single transaction that holds the
+    write lock (BEGIN IMMEDIATE), and they are checked again once the lock
+    is taken, so concurrent runs load each table once, and an interrupted
+    load is rolled back by the sqlite journal.
+    The database is named after the content hash of the source, and the
+    tables it holds are read from it, so it can't get out of sync with
+    the metadata.
+    """
+    if cache_dir is None:
+        cache_dir = _cache_dir()
+    directory = os.path.join(cache_dir, "sqlite")
+    os.makedirs(directory, exist_ok=True)
+    source = os.path.abspath(filename)
+    key = hashlib.sha1(source.encode("utf8")).hexdigest()
+    meta_path = os.path.join(directory, key + ".json")
+    stat = os.stat(filename)
+    meta, previous, content_hash, changed = None, None, None, True
+    with contextlib.suppress(FileNotFoundError, ValueError, KeyError):
+        with open(meta_path, "r", encoding="utf8") as infile:
+            cached = json.load(infile)
+        previous = cached["hash"]
+        if cached["size"] == stat.st_size:
+            if cached["mtime_ns"] == stat.st_mtime_ns:
+                meta, changed = cached, False
+            else:
+                # the hash is computed once, and reused if the content changed
+                content_hash = file_hash(filename)
+                if cached["hash"] == content_hash:
+                    cached["mtime_ns"] = stat.st_mtime_ns
+                    meta = cached
+    tables = LazyTables(filename, index=read_index(filename))
+    if meta is None:
+        meta = dict(
+            path=source,
+            size=stat.st_size,
+            mtime_ns=stat.st_mtime_ns,
+            hash=content_hash or file_hash(filename),
+            headers={name: tables.header(name) for name in tables},
+            )
+    db_name = "{}.{}.db".format(key, meta["hash"])
+    db_path = os.path.join(directory, db_name)
+    if previous is not None and previous != meta["hash"]:
+        # the database of the previous content of the file
+        with contextlib.suppress(OSError):
+            os.remove(os.path.join(directory, "{}.{}.db".format(key, previous)))
+    headers = meta["headers"]
+    names = None if query is None else referenced_tables(query, headers)
+    names = list(headers) if names is None else names
+    connection = connect(db_path, timeout=SQLITE_CACHE_TIMEOUT)
+    try:
+        if not set(names) <= _sqlite_tables(connection):
+            # another process can load the same tables before the lock is taken
+            connection.execute("BEGIN IMMEDIATE")
+            with connection:
+                loaded = _sqlite_tables(connection)
+                missing = [name for name in names if name not in loaded]
+                write_into_sql_connection(DataBase(tables), connection, missing)
+    except BaseException:
+        connection.close()
+        raise
+    if changed:
+        _write_cache_meta(meta_path, meta)
+    return db_path, connection
+
+def _sqlite_tables(connection) -> Set[str]:
+    master = "SELECT name FROM sqlite_master WHERE type='table'"
+    return {name for name, in connection.execute(master)}
+
+def _write_cache_meta(meta_path, meta):
+    temp_path = "{}.{}.tmp".format(meta_path, os.getpid())
+    with open(temp_path, "w", encoding="utf8") as outfile:
+        json.dump(meta, outfile)
+    os.replace(temp_path, meta_path)
+
+def _source_hash(filename, cache_dir) -> Tuple[str, Optional[str]]:
+    """content hash of a file, remembered as long as its size and mtime match,
+    and the previous hash recorded for the same path, None if unchanged
+    """
+    directory = os.path.join(cache_dir, "sources")
+    os.makedirs(directory, exist_ok=True)
+    source = os.path.abspath(filename)
+    key = hashlib.sha1(source.encode("utf8")).hexdigest()
+    meta_path = os.path.join(directory, key + ".json")
+    stat = os.stat(filename)
+    previous = None
+    with contextlib.suppress(FileNotFoundError, ValueError, KeyError):
+        with open(meta_path, "r", encoding="utf8") as infile:
+            cached = json.load(infile)
+        previous = cached["hash"]
+        same_size = cached["size"] == stat.st_size
+        if same_size and cached["mtime_ns"] == stat.st_mtime_ns:
+            return cached["hash"], None
+    meta = dict(
+        path=source,
+        size=stat.st_size,
+        mtime_ns=stat.st_mtime_ns,
+        hash=file_hash(filename),
+        )
+    _write_cache_meta(meta_path, meta)
+    return meta["hash"], (None if previous == meta["hash"] else previous)
+
+def _remove_columns_cache(cache_dir, content_hash):
+    """remove the columns of a content, unless another source still has it"""
+    directory = os.path.join(cache_dir, "sources")
+    for name in os.listdir(directory):
+        if not name.endswith(".json"):
+            continue
+        with contextlib.suppress(OSError, ValueError, KeyError):
+            with open(os.path.join(directory, name), "r", encoding="utf8") as infile:
+                if json.load(infile)["hash"] == content_hash:
+                    return
+    import shutil
+    shutil.rmtree(os.path.join(cache_dir, "columns", content_hash), ignore_errors=True)
+
+def cached_columns(filename, cache_dir=None) -> DataBase:
+    """read a jmt file as ColumnarTable, from a binary cache of its columns.
+
+    the cache holds a .npy file for each numeric or boolean column and a
+    json file for the other columns, plus a manifest with the headers and
+    the type of the columns.
+    It is keyed by the hash of the content of the source, and it is built
+    the first time the file is read. The numeric columns are memory mapped,
+    so they are read from the disk only when used.
+    Requires numpy, without it the file is parsed as usual.
+    """
+    np = _import_optional("numpy")
+    if np is None:
+        return read_from_jsontable(filename, columnar=True)
+    if cache_dir is None:
+        cache_dir = _cache_dir()
+    content_hash, previous = _source_hash(filename, cache_dir)
+    if previous is not None:
+        # the columns of the previous content of the file
+        _remove_columns_cache(cache_dir, previous)
+    directory = os.path.join(cache_dir, "columns", content_hash)
+    manifest_path = os.path.join(directory, "manifest.json")
+    manifest = None
+    with contextlib.suppress(FileNotFoundError, ValueError):
+        with open(manifest_path, "r", encoding="utf8") as infile:
+            manifest = json.load(infile)
+    if manifest is None:
+        database = read_from_jsontable(filename, columnar=True)
+        _write_columns_cache(database, directory)
+        return database
+    tables = {}
+    for entry in manifest["tables"]:
+        columns = []
+        for kind, column_file, column_type in entry["columns"]:
+            path = os.path.join(directory, column_file)
+            if kind == "npy":
+                columns.append(np.load(path, mmap_mode="r"))
+            else:
+                with open(path, "rb") as infile:
+                    values = _codec.loads(infile.read())
+                columns.append(_typed_column(values, column_type))
+        fallbacks = entry.get("fallbacks")
+        tables[entry["info"]["name"]] = ColumnarTable(entry["info"], columns, fallbacks)
+    return DataBase(tables=tables)
+
+def _write_columns_cache(database, directory):
+    """save the columns of the tables, see `cached_columns`"""
+    import numpy as np
+    import tempfile
+    parent = os.path.dirname(directory)
+    os.makedirs(parent, exist_ok=True)
+    temp_dir = tempfile.mkdtemp(dir=parent)
+    entries = []
+    for table_idx, table in enumerate(database.tables.values()):
+        columns = []
+        for column_idx, column in enumerate(table.columns_data):
+            stem = "{}_{}".format(table_idx, column_idx)
+            column_type = _column_type(column)
+            if column_type in ("int64", "float64", "bool"):
+                np.save(os.path.join(temp_dir, stem + ".npy"), np.asarray(column))
+                columns.append(["npy", stem + ".npy", column_type])
+            else:
+                values = _column_values(column)
+                with open(os.path.join(temp_dir, stem + ".json"), "wb") as outfile:
+                    outfile.write(_codec.dumps(values).encode("utf8"))
+                columns.append(["json", stem + ".json", column_type])
+        entry = {"info": table.info, "columns": columns}
+        entries.append(dict(entry, fallbacks=table.fallbacks))
+    with open(os.path.join(temp_dir, "manifest.json"), "w", encoding="utf8") as outfile:
+        json.dump({"tables": entries}, outfile)
+    try:
+        os.replace(temp_dir, directory)
+    except OSError:
+        # another process saved the same content first
+        import shutil
+        shutil.rmtree(temp_dir, ignore_errors=True)
+
+def query_file(filename, sql, cache=True, cache_dir=None):
+    """execute a query on a jmt file, see `query`.
+
+    with cache=True the tables are loaded from the sqlite database kept
+    in the cache (see `cached_sqlite`) instead of parsing the file again.
+    In both cases only the tables used by the query are read from the file.
+    """
+    if not cache:
+        return query(read_from_jsontable(filename, lazy=True), sql)
+    _, connection = _open_cached_sqlite(filename, cache_dir, query=sql)
+    with closing(connection):
+        result = _run_query(connection, sql)
+    return result
+
+# %%
+    
+def iter_from_jsontable(filename) -> Iterable[Table]:
+    """yield the tables of a jmt file one at a time, without loading them
+
+    the data of each table is a lazy iterator over its rows, and it is
+    valid only until the following table is requested: consume (or copy)
+    it before advancing to keep the memory bound to a single row.
+    The rows are decoded only when consumed, so skipping a table is cheap.
+    Tables are returned in file order, including repeated names.
+    The filename can also be an open binary stream, or "-" for stdin.
+    """
+    with _open_input(filename) as stream:
+        for header, rows in group(scan_file(stream)):
+            yield Table(info=header.data, data=map(_decode_raw, rows))
+
+def read_from_jsontable(filename, lazy=False, columnar=False, cache=None,
+        arrays=False):
+    """read a jmt file in a DataBase.
+
+    with lazy=True the tables are loaded from the file only when accessed,
+    using the index file if a valid one is available.
+    with columnar=True the tables are ColumnarTable, stored by columns,
+    with the types declared in a `types` table or in the headers.
+    with cache=True (or the path of a cache directory) the tables are
+    ColumnarTable read from the binary cache of the file, see `cached_columns`.
+    with arrays=True the cells of the array columns (listed in the
+    `array_columns` key of the header) are `jmt.arrays.LazyArray`,
+    decompressed when accessed. It needs numpy.
+    if the same table name is repeated, the last one is kept.
+    """
+    if arrays and (cache or columnar):
+        raise ValueError("arrays can't be decoded in columnar tables")
+    if cache:
+        cache_dir = None if cache is True else cache
+        return cached_columns(filename, cache_dir)
+    if lazy:
+        index = read_index(filename)
+        return DataBase(tables=LazyTables(filename, index=index, arrays=arrays))
+    if columnar:
+        return _read_typed_columns(filename)
+    final = {
+        table.name: Table(info=table.info, data=list(table.data))
+        for table in iter_from_jsontable(filename)
+        }
+    if arrays:
+        final = {name: _decode_arrays(table) for name, table in final.items()}
+    return DataBase(tables=final)
+
+def _decode_arrays(table: Table) -> Table:
+    """decode the array columns of the table as lazy arrays"""
+    if not table.info.get("array_columns"):
+        return table
+    # numpy is only imported when there are arrays to decode
+    from jmt.arrays import decode_table
+    return decode_table(table, lazy=True)
+
+def _read_typed_columns(filename) -> DataBase:
+    """read the tables as ColumnarTable, with the types declared in the
+    headers or in a `types` table (with the table, column and type)
+    """
+    final, declared = {}, {}
+    for table in iter_from_jsontable(filename):
+        if table.name == "types" and table.columns == ["table", "column", "type"]:
+            table = Table(info=table.info, data=list(table.data))
+            declared = _types_from_table(table)
+            # the tables read before the types table
+            for name in declared.keys() & final.keys():
+                if "types" not in final[name].info:
+                    final[name] = final[name].astype(declared[name])
+        types = _declared_types(table.info, declared)
+        final[table.name] = ColumnarTable.from_rows(table.info, table.data, types)
+    return DataBase(tables=final)
+
+def _split_ranges(filename, chunk_size) -> Iterable[Tuple[int, int]]:
+    """split a file in byte ranges of about chunk_size, ending on newlines"""
+    size = os.path.getsize(filename)
+    boundaries = [0]
+    with open(filename, "rb") as stream:
+        for position in range(chunk_size, size, chunk_size):
+            if position <= boundaries[-1]:
+                continue
+            # move to the end of the line containing the previous byte
+            stream.seek(position - 1)
+            stream.readline()
+            boundaries.append(stream.tell())
+    boundaries.append(size)
+    boundaries = sorted(set(boundaries))
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+@contextlib.contextmanager
+def _gc_paused():
+    """pause the cyclic garbage collector while building many rows: they
+    can't form cycles, and each collection would traverse all of them
+    """
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _parse_chunk(filename, start, stop):
+    """parse a range of a jmt file in a list of headers and runs of rows.
+
+    each element is a pair (is_header, payload), where the payload is the
+    header object or the list of consecutive rows.
+    """
+    with open(filename, "rb") as stream:
+        stream.seek(start)
+        chunk = stream.read(stop - start)
+    segments = []
+    with _gc_paused():
+        for line in parse_file(chunk.splitlines(keepends=True)):
+            if isinstance(line.data, dict):
+                segments.append((True, line.data))
+            elif segments and not segments[-1][0]:
+                segments[-1][1].append(line.data)
+            else:
+                segments.append((False, [line.data]))
+    return segments
+
+def read_from_jsontable_parallel(filename, workers=None, chunk_size=2**24):
+    """read a jmt file in a DataBase, parsing it with multiple processes.
+
+    the file is split in ranges of about chunk_size bytes, aligned to the
+    lines, and each range is parsed in a separate process.
+    The rows are then joined to their headers following the same rules
+    of `group`, so tables can span several ranges.
+    Compressed files are read sequentially, as well as any file with a
+    single worker, where the processes would only add overhead.
+    The rows parsed by the workers are pickled back to this process, and
+    unpickling them costs a fraction of parsing them (about a sixth, with
+    the garbage collector paused), which bounds the speedup whatever the
+    number of workers.
+    """
+    if workers is None:
+        workers = os.cpu_count() or 1
+    # the chunks can't be split in the compressed bytes
+    if _compression_of(filename) is not None or workers == 1:
+        return read_from_jsontable(filename)
+    ranges = _split_ranges(filename, chunk_size)
+    starts = [start for start, _ in ranges]
+    stops = [stop for _, stop in ranges]
+    tables = {}
+    # arrays before the first header are dropped, as well as headers
+    # with no rows following them
+    header, current = None, None
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers) as pool, _gc_paused():
+        parsed = pool.map(_parse_chunk, it.repeat(filename), starts, stops)
+        for segments in parsed:
+            for is_header, payload in segments:
+                if is_header:
+                    header, current = payload, None
+                elif header is not None:
+                    if current is None:
+                        current = Table(info=header, data=[])
+                        tables[current.name] = current
+                    current.data.extend(payload)
+    return DataBase(tables=tables)
+
+def iter_from_excel(filename) -> Iterable[Table]:
+    """yield the tables of an excel file one at a time, without loading them
+
+    the workbook is opened in read-only mode and the data of each table is
+    a lazy iterator over its rows, that joins the continuation sheets.
+    """
+    from openpyxl import load_workbook
+    workbook = load_workbook(filename, read_only=True)
+    try:
+        for name, sheetnames in _excel_sheet_groups(workbook.sheetnames):
+            parts = [
+                workbook[sheetname].iter_rows(values_only=True)
+                for sheetname in sheetnames
+                ]
+            header = next(parts[0], None)
+            if header is None:
+                continue
+            # the continuation sheets repeat the header
+            for part in parts[1:]:
+                next(part, None)
+            info = dict(columns=list(header), name=name)
+            yield Table(info, map(list, it.chain.from_iterable(parts)))
+    finally:
+        workbook.close()
+
+def read_from_excel(filename):
+    tables = {
+        table.name: Table(info=table.info, data=list(table.data))
+        for table in iter_from_excel(filename)
+        }
+    return DataBase(tables=tables)
+
+def iter_from_sqlite(filename, batch_size=10000) -> Iterable[Table]:
+    """yield the tables of a sqlite file one at a time, without loading them
+
+    the data of each table is a lazy iterator over the rows, as tuples,
+    fetched from the database `batch_size` at the time.
+    """
+    def fetch_rows(cursor):
+        for rows in iter(partial(cursor.fetchmany, batch_size), []):
+            yield from rows
+    with closing(connect(filename)) as connection:
+        query = "SELECT name FROM sqlite_master WHERE type='table';"
+        tablenames = [n[0] for n in connection.execute(query)]
+        for tablename in tablenames:
+            query = "SELECT * FROM {}".format(_quote_identifier(tablename))
+            cursor = connection.execute(query)
+            columns = [description[0] for description in cursor.description]
+            info = dict(
+                columns=columns, 
+                name=tablename,
+                )
+            yield Table(info=info, data=fetch_rows(cursor))
+
+def read_from_sqlite(filename):
+    tables = {
+        table.name: Table(info=table.info, data=list(map(list, table.data)))
+        for table in iter_from_sqlite(filename)
+        }
+    return DataBase(tables)
+
+# %% external index for random access
+
+INDEX_EXTENSION = ".jmti"
+
+class TableLocation(NamedTuple):
+    """byte positions of a table in a jmt file, as stored in the index.
+
+    data_end is the end of the last row, so the rows of the table are
+    all contained between data_start and data_end.
+    """
+    header_start: int
+    data_start: int
+    data_end: int
+    rows: int
+
+class JMTIndex:
+    """index of a jmt file, to access its tables and rows without scanning.
+
+    The index is itself a jmt file, with two tables:
+        * `tables` with the header and the byte positions of each table
+        * `offsets` with the starting byte of each row of each table,
+          followed by the end of the last row
+    The offsets are loaded from the index file only when requested.
+    For block gzip files, a `blocks` table between the two holds the
+    compressed and uncompressed position of each block.
+    """
+    _tables_columns = [
+        "name", "header", "header_start", "data_start", "data_end", "rows",
+        "offsets_at",
+        ]
+
+    def __init__(self, filename, tables, headers, offsets=None):
+        self.filename = filename
+        self.tables = tables
+        self.headers = headers
+        self._offsets = dict(offsets or {})
+        self._offsets_at = {}
+        self._index_filename = None
+        self.blocks = None
+
+    def __repr__(self) -> str:
+        return "{}(filename={!r}, tables={})".format(
+            self.__class__.__qualname__,
+            self.filename,
+            list(self.tables),
+            )
+
+    def row_offsets(self, name) -> Iterable[int]:
+        """starting byte of each row of the table, plus the end of the last"""
+        if name not in self._offsets:
+            with open(self._index_filename, "rb") as stream:
+                stream.seek(self._offsets_at[name])
+                _, offsets = _codec.loads(stream.readline())
+            self._offsets[name] = offsets
+        return self._offsets[name]
+
+    def write(self, index_filename):
+        """write the index as a jmt file next to the source"""
+        stat = os.stat(self.filename)
+        # the position of the offsets row of each table is stored relative
+        # to the beginning of the offsets section, as it comes after
+        offsets_lines = []
+        offsets_at = []
+        position = 0
+        for name in self.tables:
+            line = _codec.dumps([name, self.row_offsets(name)]) + "\n"
+            offsets_lines.append(line)
+            offsets_at.append(position)
+            position += len(line.encode("utf8"))
+        tables_header = {
+            "name": "tables",
+            "columns": self._tables_columns,
+            "tables": len(self.tables),
+            "source_size": stat.st_size,
+            "source_mtime_ns": stat.st_mtime_ns,
+            }
+        offsets_header = {"name": "offsets", "columns": ["name", "offsets"]}
+        blocks_header = {"name": "blocks", "columns": ["compressed", "uncompressed"]}
+        if self.blocks is not None:
+            tables_header["blocks"] = len(self.blocks)
+        with open(index_filename, "w", encoding="utf8", newline="\n") as outfile:
+            print(_codec.dumps(tables_header), file=outfile)
+            for (name, location), at in zip(self.tables.items(), offsets_at):
+                line = [name, self.headers[name], *location, at]
+                print(_codec.dumps(line), file=outfile)
+            if self.blocks is not None:
+                print(_codec.dumps(blocks_header), file=outfile)
+                for block in self.blocks:
+                    print(_codec.dumps(block), file=outfile)
+            print(_codec.dumps(offsets_header), file=outfile)
+            outfile.writelines(offsets_lines)
+
+    @classmethod
+    def read(cls, filename, index_filename):
+        """read an index file, return None if it does not match the source"""
+        stat = os.stat(filename)
+        with open(index_filename, "rb") as stream:
+            tables_header = _codec.loads(stream.readline())
+            valid = (
+                tables_header.get("source_size") == stat.st_size and
+                tables_header.get("source_mtime_ns") == stat.st_mtime_ns
+                )
+            if not valid:
+                return None
+            tables, headers, offsets_at = {}, {}, {}
+            for _ in range(tables_header["tables"]):
+                name, header, *location, at = _codec.loads(stream.readline())
+                tables[name] = TableLocation(*location)
+                headers[name] = header
+                offsets_at[name] = at
+            blocks = None
+            if "blocks" in tables_header:
+                stream.readline()
+                lines = it.islice(stream, tables_header["blocks"])
+                blocks = list(map(_codec.loads, lines))
+            # skip the header of the offsets section
+            stream.readline()
+            offsets_start = stream.tell()
+        index = cls(filename, tables, headers)
+        index.blocks = blocks
+        index._index_filename = index_filename
+        index._offsets_at = {
+            name: offsets_start + at for name, at in offsets_at.items()
+            }
+        return index
+
+def build_index(filename, index_filename=None) -> JMTIndex:
+    """scan a jmt file once and write its index in a sidecar file.
+
+    by default the index is saved as the filename plus the .jmti extension.
+    For compressed files the offsets refer to the uncompressed bytes, and
+    for block gzip files the index also stores the position of the blocks.
+    """
+    if index_filename is None:
+        index_filename = filename + INDEX_EXTENSION
+    index = _scan_index(filename)
+    index.write(index_filename)
+    index._index_filename = index_filename
+    return index
+
+def _scan_index(filename) -> JMTIndex:
+    """scan a jmt file once to build its index in memory"""
+    tables, headers, offsets = {}, {}, {}
+    with _open_input(filename) as stream:
+        for header, rows in group(scan_file(stream)):
+            name = header.data['name']
+            starts = []
+            for row in rows:
+                starts.append(row.start)
+            data_end = row.end
+            # if a name is repeated the last table wins, as in the reader
+            tables.pop(name, None)
+            tables[name] = TableLocation(
+                header_start=header.start,
+                data_start=starts[0],
+                data_end=data_end,
+                rows=len(starts),
+                )
+            headers[name] = header.data
+            offsets[name] = starts + [data_end]
+    index = JMTIndex(filename, tables, headers, offsets)
+    is_gzip = _compression_of(filename) == "gzip"
+    if is_gzip and BlockGzipReader.is_block_gzip(filename):
+        index.blocks = BlockGzipReader.scan_blocks(filename)
+    return index
+
+def read_index(filename, index_filename=None):
+    """read the index of a jmt file, None if missing or out of date"""
+    if index_filename is None:
+        index_filename = filename + INDEX_EXTENSION
+    try:
+        return JMTIndex.read(filename, index_filename)
+    except FileNotFoundError:
+        return None
+
+def _valid_index(filename) -> JMTIndex:
+    """the index of the sidecar file if valid, otherwise built in memory:
+    only `build_index` writes the sidecar, so reading never needs to write
+    """
+    return read_index(filename) or _scan_index(filename)
+
+def _parse_rows(chunk: bytes) -> Iterable[list]:
+    """parse the rows contained in a block of bytes of a jmt file"""
+    lines = parse_file(chunk.splitlines(keepends=True))
+    return [line.data for line in lines if isinstance(line.data, list)]
+
+class MappedRows(abcSequence):
+    """rows of a table of a memory mapped jmt file.
+
+    only the rows that are requested are decoded, using the row offsets
+    of the index to find them in the file.
+    For compressed files only the blocks with the rows are decompressed.
+    """
+    # number of rows decoded together when iterating
+    batch_size = 1024
+
+    def __init__(self, filename, offsets, ranges=None):
+        self.filename = filename
+        self.offsets = offsets
+        self._ranges = ranges if ranges is not None else _open_ranges(filename)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def _decode_range(self, start, stop) -> Iterable[list]:
+        if start >= stop:
+            return []
+        chunk = self._ranges.read(self.offsets[start], self.offsets[stop])
+        return _parse_rows(chunk)
+
+    def __getitem__(self, key):
+        if isinstance(key, slice):
+            start, stop, step = key.indices(len(self))
+            if step != 1:
+                return [self[idx] for idx in range(start, stop, step)]
+            return self._decode_range(start, stop)
+        if key < 0:
+            key += len(self)
+        if not 0 <= key < len(self):
+            raise IndexError("row index out of range")
+        chunk = self._ranges.read(self.offsets[key], self.offsets[key+1])
+        # the row could be followed by empty lines or comments
+        line, *_ = chunk.split(b"\n", 1)
+        return _codec.loads(line)
+
+    def __iter__(self):
+        for start in range(0, len(self), self.batch_size):
+            stop = min(start + self.batch_size, len(self))
+            yield from self._decode_range(start, stop)
+
+    def __eq__(self, other):
+        if not isinstance(other, (list, MappedRows)):
+            return NotImplemented
+        return len(self) == len(other) and list(self) == list(other)
+
+    def __repr__(self) -> str:
+        return "{}(filename={!r}, rows={})".format(
+            self.__class__.__qualname__,
+            self.filename,
+            len(self),
+            )
+
+    def close(self):
+        self._ranges.close()
+
+def open_table(filename, name, index=None) -> Table:
+    """return a table whose rows are read from the file only when indexed
+
+    the data of the table supports len, indexing and slicing, and only the
+    bytes of the requested rows are decoded.
+    The file stays open until the table is closed, with `Table.close`
+    or using the table as a context manager.
+    """
+    if index is None:
+        index = _valid_index(filename)
+    ranges = _open_ranges(filename, index)
+    rows = MappedRows(filename, index.row_offsets(name), ranges)
+    return Table(info=index.headers[name], data=rows)
+
+def read_table(filename, name, index=None) -> Table:
+    """read a single table, jumping directly to it using the index"""
+    if index is None:
+        index = _valid_index(filename)
+    location = index.tables[name]
+    ranges = _open_ranges(filename, index)
+    chunk = ranges.read(location.data_start, location.data_end)
+    ranges.close()
+    return Table(info=index.headers[name], data=_parse_rows(chunk))
+
+def read_rows(filename, name, start, stop, index=None) -> Iterable[list]:
+    """read the rows from start to stop (excluded) of a table"""
+    if index is None:
+        index = _valid_index(filename)
+    offsets = index.row_offsets(name)
+    start, stop, _ = slice(start, stop).indices(len(offsets) - 1)
+    if start >= stop:
+        return []
+    ranges = _open_ranges(filename, index)
+    chunk = ranges.read(offsets[start], offsets[stop])
+    ranges.close()
+    return _parse_rows(chunk)
+
+# %% streaming selection of tables
+
+def _ensure_newline(raw: bytes) -> bytes:
+    return raw if raw.endswith(b"\n") else raw + b"\n"
+
+_COMPARISONS = {
+    "==": op.eq, "!=": op.ne, "<": op.lt, "<=": op.le, ">": op.gt, ">=": op.ge,
+    }
+
+class RowPredicate:
+    """condition on a column of the rows, such as `age > 30` or `name ~ ^al`.
+
+    the operators are the comparisons (==, !=, <, <=, >, >=) and the regex
+    search (~ and its negation !~). The value is parsed as json if possible,
+    otherwise it is taken as a string.
+    """
+    _syntax = re.compile(r"^\s*(.+?)\s*(==|!=|<=|>=|!~|<|>|~)\s*(.*?)\s*$")
+
+    def __init__(self, expression: str):
+        match = self._syntax.match(expression)
+        if match is None:
+            raise ValueError("invalid row predicate: {!r}".format(expression))
+        self.expression = expression
+        self.column, self.operator, value = match.groups()
+        if self.operator in ("~", "!~"):
+            self.value = re.compile(value)
+        else:
+            try:
+                self.value = json.loads(value)
+            except ValueError:
+                self.value = value
+
+    def __repr__(self) -> str:
+        return "{}({!r})".format(self.__class__.__qualname__, self.expression)
+
+    def compile(self, columns: Iterable[str]):
+        """function evaluating the predicate on a batch of rows of a table.
+
+        it returns None if the table doesn't have the column.
+        """
+        if self.column not in columns:
+            return None
+        return partial(self.evaluate, list(columns).index(self.column))
+
+    def evaluate(self, idx: int, batch: Iterable[list]) -> Iterable[bool]:
+        """evaluate the predicate on the column idx of each row of the batch"""
+        values = [row[idx] if idx < len(row) else None for row in batch]
+        if self.operator in ("~", "!~"):
+            search = self.value.search
+            found = [isinstance(v, str) and search(v) is not None for v in values]
+            return found if self.operator == "~" else [not f for f in found]
+        compare = _COMPARISONS[self.operator]
+        np = _import_optional("numpy")
+        if np is not None and isinstance(self.value, (bool, int, float, str)):
+            if isinstance(self.value, str):
+                kinds, types = "U", {str}
+            else:
+                kinds, types = "biuf", {bool, int, float}
+            # numpy turns the numbers into strings in a mixed column, so the
+            # vectorized comparison is used only if all the values fit
+            value_types = set(map(type, values))
+            if value_types <= types:
+                column = np.array(values)
+                # integers beyond int64 become floats, losing precision
+                lossy = column.dtype.kind == "f" and float not in value_types
+                if column.dtype.kind in kinds and not lossy:
+                    return compare(column, self.value).tolist()
+        result = []
+        for value in values:
+            try:
+                result.append(bool(compare(value, self.value)))
+            except TypeError:
+                result.append(False)
+        return result
 
-# %%
+def _select_rows(rows, keep_lines, drop_lines, batch_size):
+    """raw rows that satisfy all the keep_lines and none of the drop_lines"""
+    rows = iter(rows)
+    while True:
+        batch = list(it.islice(rows, batch_size))
+        if not batch:
+            break
+        decoded = list(map(_decode_raw, batch))
+        selected = [True] * len(batch)
+        for predicate in keep_lines:
+            selected = list(map(op.and_, selected, predicate(decoded)))
+        for predicate in drop_lines:
+            dropped = predicate(decoded)
+            selected = [s and not d for s, d in zip(selected, dropped)]
+        yield from it.compress(batch, selected)
 
-def write_into_sql_connection(database, connection):
-    for name, table in database.tables.items():
-        df = table.as_pandas()
-        df.to_sql(name, con=connection, index=False)
-        
-def write_into_sqlite(database, filename):
-    with closing(connect(filename)) as connection:
-        write_into_sql_connection(database, connection)
+def filter_jsontable(
+        source, dest, keep=None, drop=None, keep_lines=(), drop_lines=(),
+        batch_size=4096,
+        ):
+    """copy the tables of a jmt file whose name matches a regex.
 
-def write_into_excel(database, filename):
+    a table is kept if its name matches `keep` (if given) and doesn't match
+    `drop` (if given). The lines of the kept tables are copied as they are,
+    without encoding them again, so the memory used doesn't depend on the
+    size of the tables, and only the headers are decoded.
+    keep_lines and drop_lines are row predicates (see `RowPredicate`):
+    a row is kept if it satisfies all of keep_lines and none of drop_lines.
+    Each predicate applies only to the tables that have its column, and
+    it is evaluated on batches of rows. Tables left with no rows are removed.
+    source and dest are filenames, open binary streams or "-" for stdin and
+    stdout.
+    """
+    keep = None if keep is None else re.compile(keep)
+    drop = None if drop is None else re.compile(drop)
+    keep_lines = [RowPredicate(p) if isinstance(p, str) else p for p in keep_lines]
+    drop_lines = [RowPredicate(p) if isinstance(p, str) else p for p in drop_lines]
+    with _open_input(source) as instream, _open_output(dest) as outstream:
+        for header, rows in group(scan_file(instream)):
+            name = header.data['name']
+            if keep is not None and not keep.match(name):
+                continue
+            if drop is not None and drop.match(name):
+                continue
+            columns = header.data.get('columns', [])
+            table_keep = [p.compile(columns) for p in keep_lines]
+            table_drop = [p.compile(columns) for p in drop_lines]
+            table_keep = [p for p in table_keep if p is not None]
+            table_drop = [p for p in table_drop if p is not None]
+            if table_keep or table_drop:
+                rows = _select_rows(rows, table_keep, table_drop, batch_size)
+                # write the header only if there is at least a row
+                first = next(rows, None)
+                if first is None:
+                    continue
+                rows = it.chain([first], rows)
+            outstream.write(_ensure_newline(header.raw))
+            outstream.writelines(_ensure_newline(row.raw) for row in rows)
+
+def list_tables(source) -> Table:
+    """name, columns and number of rows of each table of a jmt file.
+
+    only the headers are decoded, so it runs at the speed of reading.
+    The tables are listed in file order, including repeated names.
+    """
+    data = []
+    with _open_input(source) as stream:
+        for header, rows in group(scan_file(stream)):
+            number_of_rows = sum(1 for _ in rows)
+            info = header.data
+            data.append([info['name'], info.get('columns'), number_of_rows])
+    info = {"name": "tables", "columns": ["name", "columns", "rows"]}
+    return Table(info=info, data=data)
+
+# %% conversion from and to jsonlines
+
+def _jsonl_lines(columns, rows) -> Iterable[bytes]:
+    """encode each row as an object, one per line"""
+    dumps = _codec.dumps
+    for row in rows:
+        yield (dumps(dict(zip(columns, row))) + "\n").encode("utf8")
+
+def _table_to_jsonl(filename, info, start, destination):
+    """write the rows of the table starting at the offset in a jsonl file"""
+    rows = _iter_rows_at(filename, start)
+    with open(destination, "wb", buffering=2**20) as outfile:
+        outfile.writelines(_jsonl_lines(info["columns"], rows))
+    return destination
+
+def jsontable_to_jsonlines(source, dest=None, directory=".", workers=None) -> List[str]:
+    """write the tables of a jmt file as jsonlines, one object per row.
+
+    by default each table goes in its own file, named as the table plus
+    .jsonl in the directory; if the same name is repeated the last table
+    is kept. For plain files the tables are written in parallel by
+    `workers` processes, each reading its table from the file.
+    With dest (a filename, a stream or "-" for stdout) the rows of all the
+    tables are written there instead, streaming them in file order.
+    return the list of the files written.
+    """
+    if dest is not None:
+        with _open_output(dest) as output:
+            for table in iter_from_jsontable(source):
+                output.writelines(_jsonl_lines(table.columns, table.data))
+        return [dest]
+    seekable = isinstance(source, str) and source != "-"
+    seekable = seekable and _compression_of(source) is None
+    if not seekable or workers == 1:
+        written = {}
+        for table in iter_from_jsontable(source):
+            destination = os.path.join(directory, table.name + ".jsonl")
+            with open(destination, "wb", buffering=2**20) as outfile:
+                outfile.writelines(_jsonl_lines(table.columns, table.data))
+            written[destination] = None
+        return list(written)
+    # only the headers are decoded to find where the tables start
+    locations = LazyTables(source, index=read_index(source))._scan()
+    infos = [info for info, _ in locations.values()]
+    starts = [start for _, start in locations.values()]
+    destinations = [os.path.join(directory, name + ".jsonl") for name in locations]
+    from concurrent.futures import ProcessPoolExecutor
+    with ProcessPoolExecutor(workers) as pool:
+        tasks = pool.map(_table_to_jsonl, it.repeat(source), infos, starts, destinations)
+        return list(tasks)
+
+def _jsonl_rows(stream, columns, first_line) -> Iterable[list]:
+    """the values of the objects of a jsonl stream, in the order of the
+    columns, checking that each object has the same keys
+    """
+    keys = set(columns)
+    for number, line in enumerate(stream, first_line):
+        if not line.strip():
+            continue
+        obj = _codec.loads(line)
+        if not isinstance(obj, dict):
+            raise ValueError("line {}: not an object".format(number))
+        if obj.keys() != keys:
+            message = "line {}: the keys {} differ from the columns {}"
+            raise ValueError(message.format(number, sorted(obj), columns))
+        yield [obj[column] for column in columns]
+
+def _jsonl_table_name(source) -> str:
+    return os.path.splitext(os.path.basename(source))[0]
+
+def jsonlines_to_jsontable(sources, dest, names=None):
+    """write jsonl files, each as a table of a jmt file.
+
+    the columns are the keys of the first object of each source, and all
+    the other objects must have the same keys, or ValueError is raised.
+    The rows are written as they are read, so the memory does not depend
+    on the size of the sources. The sources and dest can be filenames,
+    streams or "-" for stdin and stdout. The tables are named from the
+    names, or from the filenames without the extension.
+    """
+    names = list(names or [])
+    with _open_output(dest) as output, JMTWriter(output) as writer:
+        for idx, source in enumerate(sources):
+            if idx < len(names):
+                name = names[idx]
+            elif isinstance(source, str) and source != "-":
+                name = _jsonl_table_name(source)
+            else:
+                raise ValueError("a name is needed for the tables from streams")
+            with _open_input(source) as stream:
+                first_line = 1
+                for line in stream:
+                    if line.strip():
+                        break
+                    first_line += 1
+                else:
+                    continue
+                first = _codec.loads(line)
+                if not isinstance(first, dict):
+                    raise ValueError("line {}: not an object".format(first_line))
+                columns = list(first)
+                writer.begin_table({"columns": columns, "name": name})
+                writer.append_rows([[first[column] for column in columns]])
+                writer.append_rows(_jsonl_rows(stream, columns, first_line + 1))
+
+class _SchemaBuffer:
+    """rows of the objects with the same keys, kept in memory up to a
+    number of rows and then moved to a temporary file
+    """
+    __slots__ = ("columns", "rows", "spill")
+
+    def __init__(self, columns):
+        self.columns = columns
+        self.rows = []
+        self.spill = None
+
+    def append(self, obj, max_rows):
+        self.rows.append(_codec.dumps([obj[column] for column in self.columns]))
+        if len(self.rows) >= max_rows:
+            if self.spill is None:
+                import tempfile
+                self.spill = tempfile.TemporaryFile()
+            self.spill.write(self._encoded())
+
+    def _encoded(self) -> bytes:
+        self.rows.append("")
+        encoded = "\n".join(self.rows).encode("utf8")
+        self.rows.clear()
+        return encoded
+
+    def write(self, writer):
+        if self.spill is not None:
+            self.spill.seek(0)
+            for block in iter(partial(self.spill.read, 2**20), b""):
+                writer.append_raw(block)
+        if self.rows:
+            writer.append_raw(self._encoded())
+
+    def close(self):
+        if self.spill is not None:
+            self.spill.close()
+
+def jsonlines_to_split_jsontable(
+        sources, dest, prefix="table", buffer_rows=2**16,
+        ) -> List[str]:
+    """write the objects of jsonl sources as tables, one for each set of keys.
+
+    the objects are routed to the table of their keys wherever they are
+    in the sources, the columns are the keys of the first object with
+    them. The tables are named as the prefix plus their number, in order
+    of appearance, and are written at the end in a single pass.
+    Each table keeps up to buffer_rows encoded rows in memory, then they
+    are moved to a temporary file, so the memory is bounded.
+    return the names of the tables.
+    """
+    schemas = {}
     try:
-        workbook = load_workbook(filename)
-        for name in database.names:
-            if name in workbook.sheetnames:
-                del workbook[name]
-    except FileNotFoundError:    
-        # rceate a new one and remove the default worksheet
-        workbook = Workbook() 
-        del workbook[workbook.sheetnames[0]]
-    for name, table in database.tables.items():
-        worksheet = workbook.create_sheet(name)
-        worksheet.append(table.columns)
-        for line in table.data:
-            worksheet.append(line)
-    workbook.save(filename)
+        for source in sources:
+            with _open_input(source) as stream:
+                for number, line in enumerate(stream, 1):
+                    if not line.strip():
+                        continue
+                    obj = _codec.loads(line)
+                    if not isinstance(obj, dict):
+                        raise ValueError("line {}: not an object".format(number))
+                    keys = frozenset(obj)
+                    schema = schemas.get(keys)
+                    if schema is None:
+                        schema = schemas[keys] = _SchemaBuffer(list(obj))
+                    schema.append(obj, buffer_rows)
+        names = ["{}_{}".format(prefix, idx) for idx in range(len(schemas))]
+        with _open_output(dest) as output, JMTWriter(output) as writer:
+            for name, schema in zip(names, schemas.values()):
+                writer.begin_table({"columns": schema.columns, "name": name})
+                schema.write(writer)
+    finally:
+        for schema in schemas.values():
+            schema.close()
+    return names
 
-def write_into_jsontable(database, filename):
-    with open(filename, "w", encoding="utf8") as outfile:
-        for name, table in database.tables.items():
-            info = json.dumps(table.info)
-            print(info, file=outfile)
-            for line in table.data:
-                data = json.dumps(line)
-                print(data, file=outfile)
+# %% reading from the end of the files
 
-def query(database, query, db=":memory:"):
-    """return a list of dictionary with the right column names.
-    
-    It could be converted in a jsontable afterward
+def scan_file_reversed(stream, block_size=2**16) -> Iterable[LocationData]:
+    """like `scan_file`, but from the end of a seekable binary stream.
+
+    the stream is read backwards in blocks of block_size bytes, so the
+    cost depends on how far from the end the iteration is stopped.
     """
-    def dict_from_row(row):
-        return dict(zip(row.keys(), row))  
-    with closing(connect(db)) as connection:
-        connection.row_factory = Row
-        write_into_sql_connection(database, connection)
-        cursor = connection.cursor()
-        cursor.execute(query)
-        rows = cursor.fetchall()
-        result = [dict_from_row(row) for row in rows]
-    return result 
+    position = stream.seek(0, os.SEEK_END)
+    # the end of a line that started in one of the previous blocks
+    pending = b""
+    while position > 0:
+        size = min(block_size, position)
+        position -= size
+        stream.seek(position)
+        block = stream.read(size) + pending
+        if position > 0:
+            first_end = block.find(b"\n") + 1
+            if first_end == 0:
+                pending = block
+                continue
+            pending, block = block[:first_end], block[first_end:]
+            start = position + first_end
+        else:
+            start = 0
+        pieces = block.split(b"\n")
+        lines = [piece + b"\n" for piece in pieces[:-1]]
+        if pieces[-1]:
+            lines.append(pieces[-1])
+        end = start + len(block)
+        for byte_line in reversed(lines):
+            line_start = end - len(byte_line)
+            first = byte_line.lstrip()[:1]
+            if first == b"[":
+                yield LocationData(line_start, end, None, byte_line)
+            elif first == b"{":
+                yield LocationData(line_start, end, _codec.loads(byte_line), byte_line)
+            end = line_start
 
-# %%
-    
-def read_from_jsontable(filename):
-    # utility functions for type testing later on
-    instance_of = lambda types, obj: isinstance(obj, types)
-    is_obj_or_arr = partial(instance_of, (dict, list))
-    is_arr = partial(instance_of, list)
-    # remove the empty lines
-    with open(filename, "r", encoding="utf8") as stream:
-        lines = filter(None, map(str.strip, stream))
-        # transform them in json
-        structs = (json.loads(line) for line in lines)
-        # keep only objects and arrays
-        good_elements = filter(is_obj_or_arr, structs)
-        # remove the array that are at the beginning
-        good_structs = it.dropwhile(is_arr, good_elements)
-        # group together all the objects and all the arrays
-        grouped = it.groupby(good_structs, type)
-        # drop the data type, keep only the data, we know they are alternating
-        grouped_simple = map(list, map(op.itemgetter(1), grouped))
-        # pair them, this will also remove any trailing objects with no following arrays
-        paired = zip(*([grouped_simple] * 2))
-        # if there are multiple objects (technically a mistake) keep only the last one
-        paired_single_obj = (Table(info=k[-1], data=d) for k, d in paired)
-        # generate the final data structure from the data
-        final = {table.info['name']: table for table in paired_single_obj}
-    return DataBase(tables=final)
+def _tail_reversed(stream, rows, name):
+    """header and last rows of a table, reading the stream backwards"""
+    last, has_rows = [], False
+    for line in scan_file_reversed(stream):
+        if line.data is None:
+            has_rows = True
+            if len(last) < rows:
+                last.append(line)
+        elif has_rows and (name is None or line.data.get("name") == name):
+            return line.data, last[::-1]
+        else:
+            # the rows of another table, or a header without rows
+            last, has_rows = [], False
+    return None, []
 
-def read_from_excel(filename):
-    def _extract_row_data(row):
-        return [cell.value for cell in row]
-    workbook = load_workbook(filename)
-    tables = {}
-    for sheetname in workbook.sheetnames:
-        worksheet = workbook[sheetname]
-        rows = worksheet.iter_rows()
-        header = dict(columns=_extract_row_data(next(rows)), name=sheetname)
-        data = [_extract_row_data(row) for row in rows]
-        header['name'] = sheetname
-        result = Table(header, data)
-        tables[sheetname] = result
-    return DataBase(tables=tables)
+def _tail_forward(stream, rows, name):
+    """header and last rows of a table, reading the whole stream"""
+    from collections import deque
+    header, last = None, []
+    for table_header, lines in group(scan_file(stream)):
+        if name is None or table_header.data.get("name") == name:
+            header, last = table_header.data, deque(lines, maxlen=rows)
+    return header, list(last)
 
-def read_from_sqlite(filename):
-    def dict_from_row(row):
-        return dict(zip(row.keys(), row))
-    with closing(connect(filename)) as connection:
-        connection.row_factory = Row
-        query = "SELECT name FROM sqlite_master WHERE type='table';"
-        tablenames = [n[0] for n in connection.execute(query)]
-        tables = {}
-        for tablename in tablenames:
-            cursor = connection.cursor()
-            query = "SELECT * FROM {}".format(tablename)
-            cursor.execute(query)
-            rows = cursor.fetchall()
-            rows = [dict_from_row(row) for row in rows]
-            columns = list(rows[0].keys())
-            info = dict(
-                columns=columns, 
-                name=tablename,
-                )
-            data = [[d[c] for c in columns] for d in rows]
-            table = Table(info=info, data=data)
-            tables[tablename] = table
-        db = DataBase(tables)
-    return db
+def tail_jsontable(source, rows=10, name=None) -> Table:
+    """the last rows of the last table of a jmt file, or of the named one.
+
+    plain files are read backwards from the end, so only the lines of
+    the table are read (see `scan_file_reversed`); compressed files and
+    stdin are read from the start, keeping only the last rows.
+    raise KeyError if there is no such table.
+    """
+    reversible = isinstance(source, str) and source != "-"
+    reversible = reversible and _compression_of(source) is None
+    with _open_input(source) as stream:
+        if reversible:
+            header, last = _tail_reversed(stream, rows, name)
+        else:
+            header, last = _tail_forward(stream, rows, name)
+    if header is None:
+        raise KeyError(name if name is not None else "no tables in the file")
+    return Table(info=header, data=list(map(_decode_raw, last)))
 
 # %% useful functions for testing
 @contextlib.contextmanager
@@ -238,6 +2440,17 @@ def _test_data():
             )
     return s1, s2
 
+def test_lazy_heavy_imports():
+    import subprocess, sys
+    heavy = ("pandas", "numpy", "openpyxl", "concurrent.futures.process")
+    code = "import sys, jmt.jmt; print([m for m in {!r} if m in sys.modules])"
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    output = subprocess.run(
+        [sys.executable, "-c", code.format(heavy)],
+        cwd=root, capture_output=True, text=True, check=True,
+        )
+    assert output.stdout.strip() == "[]"
+
 def test_roundrobin_jtm_file():
     s1, s2 = _test_data()
     db = DataBase({t.name: t for t in [s1, s2]})
@@ -246,6 +2459,396 @@ def test_roundrobin_jtm_file():
         db2 = read_from_jsontable(jtm_filename)
         assert db == db2
         
+def test_json_codecs():
+    lines = [
+        {"columns": ["name", "note"], "name": "àèì/ù"},
+        ["alberto", 1.1, 2**70, None, True, {"a": [1, 2.5e-10]}],
+        [float("nan"), "\u2603 \\ \""],
+        ]
+    available = [b for b in JSONCodec.backends if _import_optional(b)]
+    for backend in available:
+        codec = JSONCodec(backend, strict=True)
+        for line in lines:
+            encoded = codec.dumps(line)
+            assert encoded == json.dumps(line)
+            assert json.dumps(codec.loads(encoded)) == encoded
+            assert json.dumps(codec.loads(encoded.encode("utf8"))) == encoded
+        fast = JSONCodec(backend, strict=False)
+        for line in lines:
+            decoded = fast.loads(fast.dumps(line))
+            assert json.dumps(decoded) == json.dumps(line)
+        assert fast.dumps([None, 1.5]).replace(" ", "") == "[null,1.5]"
+    with contextlib.suppress(ValueError):
+        JSONCodec("not a json library")
+        assert False
+
+def test_jtm_writer():
+    s1, s2 = _test_data()
+    with _temp_file("mydata.jtm") as jtm_filename:
+        with JMTWriter(jtm_filename, batch_size=2) as writer:
+            writer.begin_table(s1.info)
+            writer.append_rows(iter(s1.data[:1]))
+            writer.append_rows(row for row in s1.data[1:])
+            writer.write_table(s2)
+        db = read_from_jsontable(jtm_filename)
+        assert db == DataBase({t.name: t for t in [s1, s2]})
+    output = io.StringIO()
+    with JMTWriter(output) as writer:
+        with contextlib.suppress(ValueError):
+            writer.append_rows(s1.data)
+            assert False
+        writer.write_table(s1)
+    expected = [json.dumps(line) for line in [s1.info] + s1.data]
+    assert output.getvalue() == "\n".join(expected) + "\n"
+
+def test_lazy_jtm_reading():
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with _temp_file("mydata.jtm") as jtm_filename:
+        write_into_jsontable(db, jtm_filename)
+        # add noise that the reader should ignore
+        with open(jtm_filename, "a", encoding="utf8") as outfile:
+            print('"comment"\n\n{"name": "void", "columns": []}', file=outfile)
+        tables = list(iter_from_jsontable(jtm_filename))
+        assert [t.name for t in tables] == ["ages", "wealths"]
+        lazy_db = read_from_jsontable(jtm_filename, lazy=True)
+        assert not lazy_db.tables._loaded
+        assert lazy_db.tables['wealths'] == s2
+        assert list(lazy_db.tables._loaded) == ['wealths']
+        assert lazy_db == db
+
+def test_columnar_table():
+    s1, s2 = _test_data()
+    c1 = s1.to_columnar()
+    assert c1 == s1 and s1 == c1
+    assert c1.to_rows() == s1
+    assert len(c1) == 3
+    assert c1[1] == s1[1] and c1[-1] == s1[-1] and c1[:2] == s1[:2]
+    try:
+        Table(info={'columns': ['a', 'b'], "name": "short"}, data=[[1, 2], [3]]).to_columnar()
+    except ValueError as error:
+        assert str(error) == "row 1: 1 values for 2 columns"
+    else:
+        raise AssertionError("the rows must have a value for each column")
+    assert _column_values(c1.columns_data[1]) == [2, 4, 6]
+    df = c1.as_pandas()
+    assert list(df.columns) == s1.columns
+    assert str(df['age'].dtype) == 'int64'
+    mixed = Table(
+            info={'columns': ['a', 'b', 'c'], "name": "mixed"}, 
+            data=[[1, 1.5, True], [2**70, None, False]],
+            ).to_columnar()
+    assert mixed.data == [[1, 1.5, True], [2**70, None, False]]
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with _temp_file("mydata.jtm") as jtm_filename:
+        write_into_jsontable(db, jtm_filename)
+        db2 = read_from_jsontable(jtm_filename, columnar=True)
+        assert isinstance(db2.tables['ages'], ColumnarTable)
+        assert db2 == db
+
+def test_typed_columns():
+    s1, s2 = _test_data()
+    typed = ColumnarTable.from_rows(s1.info, s1.data, {'age': 'float64'})
+    assert typed.types == ['object', 'float64'] and typed == s1
+    assert s1.to_columnar().astype(['category', None]).types == ['category', 'int64']
+    info = {'columns': ['job', 'rate'], "name": "jobs", "types": ['category', 'int']}
+    jobs = Table(info=info, data=[['doctor', 1], [None, 2], ['doctor', 3]])
+    columnar = jobs.to_columnar()
+    assert columnar.types == ['category', 'int64'] and columnar == jobs
+    assert columnar.columns_data[0].categories == ['doctor']
+    assert columnar[1:] == [[None, 2], ['doctor', 3]]
+    assert str(columnar.as_pandas()['job'].dtype) == 'category'
+    for types in [{'name': 'int64'}, ['string'], ['string', 'unknown']]:
+        try:
+            ColumnarTable.from_rows(s1.info, s1.data, types)
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("the types don't fit the columns")
+    # the nulls are NaN in float columns, int columns fall back to objects
+    nulls = ColumnarTable.from_rows(
+        {'columns': ['a', 'b', 'c'], "name": "nulls"},
+        [[1, 2, True], [None, None, None]],
+        ['int', 'float', 'bool'],
+        )
+    assert nulls.types == ['object', 'float64', 'object']
+    assert nulls.data[1][0] is None and nulls.data[1][1] != nulls.data[1][1]
+    assert sorted(nulls.fallbacks) == ['a', 'c']
+    assert s1.to_columnar().astype({'age': 'float64'}).types == ['object', 'float64']
+    types = Table(
+        info={'columns': ['table', 'column', 'type'], "name": "types"},
+        data=[['ages', 'age', 'number'], ['wealths', 'name', 'categorical']],
+        )
+    with _temp_file("mydata.jtm") as jtm_filename:
+        # the types table is applied also to the tables before it
+        write_into_jsontable(DataBase({t.name: t for t in [s1, types, s2]}), jtm_filename)
+        db = read_from_jsontable(jtm_filename, columnar=True)
+        assert db.tables['ages'].types == ['object', 'float64']
+        assert db.tables['wealths'].types == ['category', 'int64']
+    with _temp_file("mydata.db") as db_filename:
+        with closing(connect(db_filename)) as connection:
+            write_table_into_sql_connection(connection, info, iter(jobs.data))
+            schema = connection.execute("SELECT sql FROM sqlite_master").fetchone()[0]
+        assert schema == 'CREATE TABLE "jobs" ("job" TEXT, "rate" INTEGER)'
+        try:
+            with closing(connect(":memory:")) as connection:
+                wrong = dict(info, types=['category', 'decimal'])
+                write_table_into_sql_connection(connection, wrong, iter(jobs.data))
+        except ValueError:
+            pass
+        else:
+            raise AssertionError("the type is not known")
+
+def test_parallel_jtm_reading():
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with _temp_file("mydata.jtm") as jtm_filename:
+        write_into_jsontable(db, jtm_filename)
+        # tiny chunks to have tables split between several processes
+        db2 = read_from_jsontable_parallel(jtm_filename, 2, chunk_size=7)
+        assert db == db2
+
+def test_streaming_filter():
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with _temp_file("mydata.jtm") as jtm_filename:
+        write_into_jsontable(db, jtm_filename)
+        # the lines are copied as they are, indentation included
+        with open(jtm_filename, "ab") as outfile:
+            outfile.write(b'{"name": "agenda", "columns": ["a"]}\n  [1]')
+        output = io.BytesIO()
+        filter_jsontable(jtm_filename, output, keep="age", drop=".*s$")
+        assert output.getvalue() == b'{"name": "agenda", "columns": ["a"]}\n  [1]\n'
+        output.seek(0)
+        filter_jsontable(output, jtm_filename, drop="agenda")
+        assert read_from_jsontable(jtm_filename) == DataBase({})
+        write_into_jsontable(db, jtm_filename)
+        with open(jtm_filename, "rb") as instream:
+            output = io.BytesIO()
+            filter_jsontable(instream, output, keep="wealths")
+        output.seek(0)
+        assert read_from_jsontable(output) == DataBase({s2.name: s2})
+
+def test_row_predicates():
+    rows = [["a", 1], ["b", 2.5], ["c", None], ["d", "x"], ["e"]]
+    assert RowPredicate("age > 1").compile(["name", "age"])(rows) == [False, True, False, False, False]
+    assert RowPredicate("age>1").compile(["name", "age"])(rows[:2]) == [False, True]
+    assert RowPredicate("name ~ ^[ab]").compile(["name", "age"])(rows) == [True, True, False, False, False]
+    assert RowPredicate('name != "a"').compile(["name", "age"])(rows[:2]) == [False, True]
+    assert RowPredicate("other == 1").compile(["name", "age"]) is None
+    # the strings are never equal to numbers or booleans
+    mixed = [["a", 1], ["b", True], ["c", 5], ["d", "1"], ["e", "True"], ["f", "a"]]
+    assert RowPredicate('age == "1"').compile(["name", "age"])(mixed) == [False] * 3 + [True, False, False]
+    assert RowPredicate('age == "True"').compile(["name", "age"])(mixed) == [False] * 4 + [True, False]
+    assert RowPredicate('age < "b"').compile(["name", "age"])(mixed) == [False] * 3 + [True] * 3
+    assert RowPredicate('age < "b"').compile(["name", "age"])(mixed[3:]) == [True] * 3
+    assert RowPredicate("age >= 1").compile(["name", "age"])(mixed[:3]) == [True] * 3
+    big = [["a", 2**63 + 1], ["b", -1]]
+    assert RowPredicate("age == {}".format(2**63)).compile(["name", "age"])(big) == [False, False]
+    with contextlib.suppress(ValueError):
+        RowPredicate("no operator")
+        assert False
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with _temp_file("mydata.jtm") as jtm_filename:
+        write_into_jsontable(db, jtm_filename)
+        output = io.BytesIO()
+        filter_jsontable(
+            jtm_filename, output, keep_lines=["age > 3"], drop_lines=["name ~ ^b"],
+            batch_size=2,
+            )
+        output.seek(0)
+        result = read_from_jsontable(output)
+        assert result.tables['ages'].data == [['carlos', 6]]
+        assert result.tables['wealths'].data == [['alberto', 3], ['diana', 7]]
+        output = io.BytesIO()
+        filter_jsontable(jtm_filename, output, keep_lines=["wealth > 10"])
+        assert output.getvalue().splitlines()[0] == json.dumps(s1.info).encode()
+        output.seek(0)
+        assert read_from_jsontable(output).names == ['ages']
+
+def test_header_scanning():
+    lines = b'[0]\n{"name": "a", "columns": ["x"]}\n"comment"\n  [1]\n\n[2, {"b": 3}]\n'
+    scanned = list(scan_file(io.BytesIO(lines)))
+    assert [line.data for line in scanned] == [None, {"name": "a", "columns": ["x"]}, None, None]
+    assert [line.start for line in scanned] == [0, 4, 46, 53]
+    assert list(map(_decode_raw, scanned[2:])) == [[1], [2, {"b": 3}]]
+    s1, s2 = _test_data()
+    with _temp_file("mydata.jtm") as jtm_filename:
+        write_into_jsontable(DataBase({t.name: t for t in [s1, s2]}), jtm_filename)
+        # the rows of a broken table are never decoded if not needed
+        with open(jtm_filename, "ab") as outfile:
+            outfile.write(b'{"name": "broken", "columns": ["a"]}\n[not json\n')
+        expected = [['ages', s1.columns, 3], ['wealths', s2.columns, 3], ['broken', ['a'], 1]]
+        assert list_tables(jtm_filename).data == expected
+        assert [t.name for t in iter_from_jsontable(jtm_filename)] == ['ages', 'wealths', 'broken']
+
+def test_compressed_jtm_files():
+    import gc
+    import gzip
+    import warnings
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    for extension in [".gz", ".bz2", ".xz"]:
+        with _temp_file("mydata.jtm" + extension) as jtm_filename:
+            write_into_jsontable(db, jtm_filename)
+            assert _compression_of(jtm_filename) is not None
+            # the compressed files are closed after reading them
+            with warnings.catch_warnings(record=True) as caught:
+                warnings.simplefilter("always", ResourceWarning)
+                assert read_from_jsontable(jtm_filename) == db
+                assert read_from_jsontable(jtm_filename, lazy=True) == db
+                gc.collect()
+            assert not [w for w in caught if issubclass(w.category, ResourceWarning)]
+            with _temp_file(jtm_filename + INDEX_EXTENSION):
+                index = build_index(jtm_filename)
+                assert (index.blocks is not None) == (extension == ".gz")
+                assert read_table(jtm_filename, 'wealths') == s2
+                assert read_rows(jtm_filename, 'ages', 1, 3) == s1.data[1:3]
+    # small blocks, to have the tables spread over several of them
+    with _temp_file("mydata.jtm.gz") as jtm_filename:
+        with BlockGzipWriter(jtm_filename, block_size=50) as stream:
+            with JMTWriter(stream) as writer:
+                for table in [s1, s2]:
+                    writer.write_table(table)
+        with gzip.open(jtm_filename, "rb") as stream:
+            assert read_from_jsontable(stream) == db
+        with _temp_file(jtm_filename + INDEX_EXTENSION):
+            build_index(jtm_filename)
+            index = read_index(jtm_filename)
+            assert len(index.blocks) > 4
+            with open_table(jtm_filename, 'wealths', index) as table:
+                assert table[1:] == s2.data[1:] and table[0] == s2.data[0]
+            assert read_table(jtm_filename, 'ages', index) == s1
+
+def test_jsonlines_conversion():
+    import tempfile
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with contextlib.ExitStack() as stack:
+        jtm_filename = stack.enter_context(_temp_file("mydata.jtm"))
+        directory = stack.enter_context(tempfile.TemporaryDirectory())
+        write_into_jsontable(db, jtm_filename)
+        for workers in [1, 2]:
+            written = jsontable_to_jsonlines(jtm_filename, directory=directory, workers=workers)
+            assert [os.path.basename(name) for name in written] == ["ages.jsonl", "wealths.jsonl"]
+            with open(written[0], "rb") as infile:
+                assert infile.readline() == b'{"name": "alberto", "age": 2}\n'
+            output = io.BytesIO()
+            jsonlines_to_jsontable(written, output)
+            output.seek(0)
+            assert read_from_jsontable(output) == db
+        output = io.BytesIO()
+        jsontable_to_jsonlines(jtm_filename, output)
+        assert output.getvalue().count(b"\n") == 6
+        # the rows of streams need the name of their table
+        source = io.BytesIO(b'\n{"name": "alberto", "age": 2}\n{"age": 4, "name": "barbara"}\n')
+        output = io.BytesIO()
+        jsonlines_to_jsontable([source], output, names=["ages"])
+        output.seek(0)
+        assert read_from_jsontable(output) == DataBase({"ages": Table(s1.info, s1.data[:2])})
+        try:
+            source = io.BytesIO(b'{"name": "alberto", "age": 2}\n{"name": "barbara"}\n')
+            jsonlines_to_jsontable([source], io.BytesIO(), names=["ages"])
+        except ValueError as error:
+            assert str(error).startswith("line 2:")
+        else:
+            raise AssertionError("the keys don't match the columns")
+        for content, number in [(b'[1]\n', 1), (b'{"age": 2}\n\n[1]\n', 3)]:
+            try:
+                jsonlines_to_jsontable([io.BytesIO(content)], io.BytesIO(), names=["ages"])
+            except ValueError as error:
+                assert str(error) == "line {}: not an object".format(number)
+            else:
+                raise AssertionError("the line is not an object")
+
+def test_jsonlines_splitting():
+    lines = [
+        {"name": "alberto", "age": 2},
+        {"name": "alberto", "wealth": 3},
+        {"age": 4, "name": "barbara"},
+        {"event": "login"},
+        {"name": "barbara", "wealth": 5},
+        {"name": "carlos", "age": 6},
+        {"wealth": 7, "name": "diana"},
+        ]
+    content = "\n".join(map(json.dumps, lines)).encode("utf8")
+    s1, s2 = _test_data()
+    for buffer_rows in [1, 2, 100]:
+        output = io.BytesIO()
+        names = jsonlines_to_split_jsontable(
+            [io.BytesIO(content)], output, prefix="events", buffer_rows=buffer_rows,
+            )
+        assert names == ["events_0", "events_1", "events_2"]
+        output.seek(0)
+        db = read_from_jsontable(output)
+        assert db.tables["events_0"].data == s1.data
+        assert db.tables["events_1"].data == s2.data
+        assert db.tables["events_2"] == Table({"columns": ["event"], "name": "events_2"}, [["login"]])
+
+def test_reversed_reading():
+    s1, s2 = _test_data()
+    content = (
+        b'[0]\n{"name": "ages", "columns": ["name", "age"]}\n'
+        b'["alberto", 2]\n["barbara", 4]\n["carlos", 6]\n'
+        b'{"name": "other", "columns": ["a"]}\n{"name": "wealths", "columns": ["name", "wealth"]}\n'
+        b'  ["alberto", 3]\n\n["barbara", 5]\n["diana", 7]\n"comment"\n{"name": "empty", "columns": []}'
+        )
+    forward = list(scan_file(io.BytesIO(content).readlines()))
+    for block_size in [1, 7, 2**16]:
+        backward = list(scan_file_reversed(io.BytesIO(content), block_size))
+        assert backward == forward[::-1]
+    with _temp_file("mydata.jtm") as jtm_filename:
+        with open(jtm_filename, "wb") as outfile:
+            outfile.write(content)
+        # the file is read backwards, the stream forward
+        for source in [lambda: jtm_filename, lambda: io.BytesIO(content)]:
+            assert tail_jsontable(source(), 2) == Table(s2.info, s2.data[1:])
+            assert tail_jsontable(source(), 5, "ages") == s1
+            assert tail_jsontable(source(), 0, "ages") == Table(s1.info, [])
+            for name in ["other", "empty", "missing"]:
+                try:
+                    tail_jsontable(source(), 2, name)
+                except KeyError:
+                    pass
+                else:
+                    raise AssertionError("the table has no rows")
+
+def test_jtm_index():
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with _temp_file("mydata.jtm") as jtm_filename:
+        write_into_jsontable(db, jtm_filename)
+        with _temp_file(jtm_filename + INDEX_EXTENSION) as index_filename:
+            assert read_index(jtm_filename) is None
+            # without a sidecar the index is built in memory, not written
+            assert read_table(jtm_filename, 'wealths') == s2
+            assert read_rows(jtm_filename, 'ages', 1, 3) == s1.data[1:3]
+            with open_table(jtm_filename, 'ages') as table:
+                assert table == s1
+            assert not os.path.exists(index_filename)
+            build_index(jtm_filename)
+            index = read_index(jtm_filename)
+            assert index.tables['wealths'].rows == 3
+            assert read_table(jtm_filename, 'wealths', index) == s2
+            rows = read_rows(jtm_filename, 'ages', 1, 3, index)
+            assert rows == s1.data[1:3]
+            # the index is a valid jmt file itself
+            index_db = read_from_jsontable(index_filename)
+            assert index_db.names == ["tables", "offsets"]
+            assert read_from_jsontable(jtm_filename, lazy=True) == db
+            table = open_table(jtm_filename, 'ages', index)
+            assert len(table) == 3
+            assert table[1] == s1.data[1]
+            assert table[-1] == s1.data[-1]
+            assert table[0:2] == s1.data[0:2]
+            assert table[::2] == s1.data[::2]
+            assert table == s1
+            table.close()
+            # modifying the source makes the index invalid
+            write_into_jsontable(DataBase({s1.name: s1}), jtm_filename)
+            assert read_index(jtm_filename) is None
+
 def test_roundrobin_xlsx_file():
     s1, s2 = _test_data()
     db = DataBase({t.name: t for t in [s1, s2]})
@@ -254,6 +2857,23 @@ def test_roundrobin_xlsx_file():
         db2 = read_from_excel(xlsx_filename)
         assert db == db2
         
+def test_excel_continuation_sheets():
+    from openpyxl import load_workbook
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with _temp_file("myexcel.xlsx") as xlsx_filename:
+        write_tables_into_excel([s1, s2], xlsx_filename, max_rows=3)
+        workbook = load_workbook(xlsx_filename, read_only=True)
+        assert workbook.sheetnames == ["ages", "ages~2", "wealths", "wealths~2"]
+        workbook.close()
+        assert read_from_excel(xlsx_filename) == db
+        # updating the existing file replaces all the sheets of the table
+        write_tables_into_excel([s2], xlsx_filename)
+        workbook = load_workbook(xlsx_filename, read_only=True)
+        assert workbook.sheetnames == ["ages", "ages~2", "wealths"]
+        workbook.close()
+        assert read_from_excel(xlsx_filename) == db
+
 def test_roundrobin_sqlite_file():
     s1, s2 = _test_data()
     db = DataBase({t.name: t for t in [s1, s2]})
@@ -262,6 +2882,128 @@ def test_roundrobin_sqlite_file():
         db2 = read_from_sqlite(sqlite_filename)
         assert db == db2
     
+def test_sqlite_native_writer():
+    table = Table(
+            info={'columns': ['a', 'b', 'c', 'd'], "name": "mixed"}, 
+            data=[[1, 1.5, "x", None], [2, 3, "y", [1, 2]], [3, None, "z", 4]],
+            )
+    with closing(connect(":memory:")) as connection:
+        write_table_into_sql_connection(connection, table.info, table.data, chunk_size=2)
+        schema = connection.execute("SELECT sql FROM sqlite_master").fetchone()[0]
+        assert schema == 'CREATE TABLE "mixed" ("a" INTEGER, "b" REAL, "c" TEXT, "d")'
+        rows = connection.execute('SELECT * FROM "mixed"').fetchall()
+        assert rows == [(1, 1.5, "x", None), (2, 3.0, "y", "[1, 2]"), (3, None, "z", 4)]
+        with contextlib.suppress(sqlite3.OperationalError):
+            write_table_into_sql_connection(connection, table.info, table.data)
+            assert False
+        write_table_into_sql_connection(connection, table.info, table.data, "append")
+        assert len(connection.execute('SELECT * FROM "mixed"').fetchall()) == 6
+        # structured values first appearing after the first row of a later chunk
+        info = {'columns': ['a', 'b'], "name": "late"}
+        data = [[1, 2], [2, 3], [4, 5], [3, [1]]]
+        write_table_into_sql_connection(connection, info, data, chunk_size=2)
+        rows = connection.execute('SELECT * FROM "late"').fetchall()
+        assert rows == [(1, 2), (2, 3), (4, 5), (3, "[1]")]
+
+def test_sqlite_streaming_reader():
+    s1, _ = _test_data()
+    empty = Table(info={'columns': ['a', 'b'], "name": "empty"}, data=[])
+    with _temp_file("mydatabase.db") as sqlite_filename:
+        write_into_sqlite(DataBase({t.name: t for t in [s1, empty]}), sqlite_filename)
+        tables = iter_from_sqlite(sqlite_filename, batch_size=2)
+        ages = next(tables)
+        assert ages.info == s1.info
+        assert list(ages.data) == [tuple(row) for row in s1.data]
+        assert next(tables).columns == ['a', 'b']
+        assert read_from_sqlite(sqlite_filename).tables['empty'] == empty
+
+def test_columns_cache():
+    import tempfile
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with contextlib.ExitStack() as stack:
+        jtm_filename = stack.enter_context(_temp_file("mydata.jtm"))
+        cache_dir = stack.enter_context(tempfile.TemporaryDirectory())
+        write_into_jsontable(db, jtm_filename)
+        first = read_from_jsontable(jtm_filename, cache=cache_dir)
+        assert all(isinstance(t, ColumnarTable) for t in first.tables.values())
+        assert first == db
+        (directory,) = os.listdir(os.path.join(cache_dir, "columns"))
+        assert "manifest.json" in os.listdir(os.path.join(cache_dir, "columns", directory))
+        second = read_from_jsontable(jtm_filename, cache=cache_dir)
+        assert second == db
+        assert second.tables["ages"].columns_data[1].dtype == "int64"
+        assert second.tables["ages"].as_pandas().equals(s1.as_pandas())
+        # a new content replaces the entry of the previous one...
+        write_into_jsontable(DataBase({'ages': s1}), jtm_filename)
+        os.utime(jtm_filename, ns=(0, 0))
+        assert read_from_jsontable(jtm_filename, cache=cache_dir).names == ["ages"]
+        (replaced,) = os.listdir(os.path.join(cache_dir, "columns"))
+        assert replaced != directory
+        # ...unless another file still has the same content
+        other_filename = stack.enter_context(_temp_file("other.jtm"))
+        write_into_jsontable(DataBase({'ages': s1}), other_filename)
+        assert read_from_jsontable(other_filename, cache=cache_dir).names == ["ages"]
+        write_into_jsontable(db, jtm_filename)
+        assert read_from_jsontable(jtm_filename, cache=cache_dir) == db
+        assert len(os.listdir(os.path.join(cache_dir, "columns"))) == 2
+
+def test_sql_query_cache():
+    import tempfile
+    s1, s2 = _test_data()
+    db = DataBase({t.name: t for t in [s1, s2]})
+    sql = "SELECT name FROM ages WHERE age > 3"
+    with tempfile.TemporaryDirectory() as cache_dir:
+        with _temp_file("mydata.jtm") as jtm_filename:
+            write_into_jsontable(db, jtm_filename)
+            result = query_file(jtm_filename, sql, cache_dir=cache_dir)
+            assert result == [{'name': 'barbara'}, {'name': 'carlos'}]
+            db_path = cached_sqlite(jtm_filename, cache_dir, query=sql)
+            assert read_from_sqlite(db_path).names == ['ages']
+            built = os.stat(db_path).st_mtime_ns
+            # same content, new modification time: the cache is still valid
+            os.utime(jtm_filename, ns=(0, 0))
+            assert query_file(jtm_filename, sql, cache_dir=cache_dir) == result
+            assert os.stat(db_path).st_mtime_ns == built
+            # the metadata is written only when it changes
+            meta_path = os.path.join(cache_dir, "sqlite", os.path.basename(db_path).split(".")[0] + ".json")
+            meta_inode = os.stat(meta_path).st_ino
+            assert query_file(jtm_filename, sql, cache_dir=cache_dir) == result
+            assert os.stat(meta_path).st_ino == meta_inode
+            # the new tables are added to the same database, in a single
+            # transaction, and the tables already loaded are kept
+            with closing(connect(db_path)) as connection:
+                connection.execute("INSERT INTO ages VALUES ('daniela', 8)")
+                connection.commit()
+            assert cached_sqlite(jtm_filename, cache_dir) == db_path
+            assert len(read_from_sqlite(db_path).tables['ages']) == 4
+            assert sorted(read_from_sqlite(db_path).names) == ['ages', 'wealths']
+            files = sorted(os.listdir(os.path.join(cache_dir, "sqlite")))
+            assert [os.path.splitext(name)[1] for name in files] == ['.db', '.json']
+            # different content: the cache is rebuilt
+            write_into_jsontable(DataBase({s2.name: s2}), jtm_filename)
+            sql = "SELECT count(*) AS n FROM wealths"
+            assert query_file(jtm_filename, sql, cache_dir=cache_dir) == [{'n': 3}]
+            assert query_file(jtm_filename, sql, cache=False) == [{'n': 3}]
+            assert not os.path.exists(db_path)
+            # same size, different content: the file is hashed only once
+            with open(jtm_filename, "rb") as infile:
+                content = infile.read()
+            with open(jtm_filename, "wb") as outfile:
+                outfile.write(content.replace(b"3]", b"4]"))
+            os.utime(jtm_filename, ns=(1, 1))
+            hashed = []
+            def counting_hash(filename):
+                hashed.append(filename)
+                return original_hash(filename)
+            original_hash = globals()["file_hash"]
+            globals()["file_hash"] = counting_hash
+            try:
+                assert query_file(jtm_filename, sql, cache_dir=cache_dir) == [{'n': 3}]
+            finally:
+                globals()["file_hash"] = original_hash
+            assert len(hashed) == 1
+
 def test_sql_query():
     s1, s2 = _test_data()
     db = DataBase({t.name: t for t in [s1, s2]})
@@ -277,15 +3019,34 @@ def test_sql_query():
                 ]
     assert result == expected
     
+def test_sql_query_referenced_tables():
+    s1, s2 = _test_data()
+    headers = {t.name: t.info for t in [s1, s2]}
+    sql = "SELECT count(*) AS n FROM wealths"
+    assert referenced_tables(sql, headers) == ['wealths']
+    sql = "WITH w AS (SELECT * FROM wealths) SELECT * FROM ages JOIN w"
+    assert referenced_tables(sql, headers) == ['ages', 'wealths']
+    assert referenced_tables("SELECT * FROM nothing", headers) is None
+    db = DataBase({t.name: t for t in [s1, s2]})
+    with _temp_file("mydata.jtm") as jtm_filename:
+        write_into_jsontable(db, jtm_filename)
+        lazy_db = read_from_jsontable(jtm_filename, lazy=True)
+        assert query(lazy_db, "SELECT count(*) AS n FROM ages") == [{'n': 3}]
+        assert list(lazy_db.tables._loaded) == ['ages']
+    
 # %%
 
 def main_query(args):
     filename = args.filename
-    query = args.query
-    db = read_from_jsontable(filename)
-    result = query(db, query)
+    sql = args.query
+    result = query_file(filename, sql, cache=args.cache)
     for line in result:
-        print(json.dumps(line))
+        print(_codec.dumps(line))
+
+def main_index(args):
+    source = args.source_filename
+    dest = args.index_filename
+    build_index(source, dest)
 
 def main_example(args):
     filename = args.filename
@@ -296,39 +3057,72 @@ def main_example(args):
 def main_xlsx2jtm(args):
     source = args.source_filename
     dest = args.destination_filename
-    db = read_from_excel(source)
-    write_into_jsontable(db, dest)
+    with JMTWriter(dest) as writer:
+        for table in iter_from_excel(source):
+            writer.write_table(table)
 
 def main_jtm2xlsx(args):
     source = args.source_filename
     dest = args.destination_filename
-    db = read_from_jsontable(source)
-    write_into_excel(db, dest)
+    # the rows are streamed from the file, one table at a time
+    tables = LazyTables(source, index=read_index(source))
+    write_tables_into_excel(
+        (Table(tables.header(name), tables.iter_rows(name)) for name in tables),
+        dest,
+        )
 
 def main_sqlite2jtm(args):
     source = args.source_filename
     dest = args.destination_filename
-    db = read_from_sqlite(source)
-    write_into_jsontable(db, dest)
+    with JMTWriter(dest) as writer:
+        for table in iter_from_sqlite(source):
+            writer.write_table(table)
 
 def main_jtm2sqlite(args):
     source = args.source_filename
     dest = args.destination_filename
-    db = read_from_jsontable(source)
-    write_into_sqlite(db, dest)
+    # stream the tables, a repeated table replaces the previous one
+    written = set()
+    with closing(connect(dest)) as connection:
+        _tune_for_bulk_load(connection)
+        for table in iter_from_jsontable(source):
+            if_exists = "replace" if table.name in written else "fail"
+            write_table_into_sql_connection(
+                connection, table.info, table.data, if_exists=if_exists,
+                )
+            written.add(table.name)
     
 def main_filter(args):
     regex = args.regex
-    regex = re.compile(regex)
     source = args.source_filename
     dest = args.destination_filename
-    db = read_from_jsontable(source)
-    db2 = DataBase({
-        name: table 
-        for (name, table) in db.tables.items() 
-        if regex.match(name)
-        })
-    write_into_jsontable(db2, dest)
+    if args.drop:
+        filter_jsontable(source, dest, drop=regex)
+    else:
+        filter_jsontable(source, dest, keep=regex)
+
+def main_ls(args):
+    with _open_output("-") as output, JMTWriter(output) as writer:
+        writer.write_table(list_tables(args.source_filename))
+
+def main_grep(args):
+    filter_jsontable(
+        args.input,
+        args.output,
+        keep=args.keep_table,
+        drop=args.drop_table,
+        keep_lines=args.keep_line,
+        drop_lines=args.drop_line,
+        )
+
+def main_tail(args):
+    try:
+        table = tail_jsontable(args.source_filename, args.lines, args.table)
+    except KeyError:
+        print("table not found: {}".format(args.table or "no tables"), file=sys.stderr)
+        sys.exit(1)
+    with _open_output("-") as output, JMTWriter(output) as writer:
+        writer.write_table(table)
 
 def main_jtm2jsonl(args):
     """ jtm jtm2jsonl example.jtm
@@ -337,48 +3131,44 @@ def main_jtm2jsonl(args):
     * wealths.jsonl
     containing a series of object
     """
-    source = args.source
-    db = read_from_jsontable(source)
-    for name, table in db.tables.items():
-        source_trim = ".".join(source.split('.')[:-1])
-        destination = name+".jsonl"
-        columns = table.columns
-        with open(destination, "w", encoding="utf8") as outfile:
-            for line in table.data:
-                line_obj = dict(zip(columns, line))
-                print(json.dumps(line_obj), file=outfile)
+    dest = "-" if args.stdout else None
+    jsontable_to_jsonlines(args.source, dest, args.directory, args.workers)
 
 def main_jsonl2jtm(args):
     """ jtm jsonl2jtm example_rebuilt.jtm *.jsonl
     rebuilds the example file that was split by jtm2jsonl
     """
-    sources = args.sources
-    dest = args.destination
-    tables = {}
-    for source in sources:
-        with open(source, "r") as infile:
-            lines = [json.loads(line.strip()) for line in infile]
-            keys = [list(line.keys()) for line in lines]
-            first_base = keys[0]
-            first = set(first_base)
-            same_keys = all(set(other)==first for other in keys[1:])
-            assert same_keys
-            source_trim =  ".".join(source.split('.')[:-1])
-            header = {"columns": list(first_base), "name": source_trim}
-            data = [[d[k] for k in first_base] for d in lines]
-            table = Table(
-                    info=header,
-                    data=data,
-                    )
-            tables[source_trim] = table
-    db = DataBase(tables)
-    write_into_jsontable(db, dest)
+    try:
+        if args.split:
+            prefix = args.name[0] if args.name else "table"
+            if not args.name and args.sources[0] != "-":
+                prefix = _jsonl_table_name(args.sources[0])
+            jsonlines_to_split_jsontable(args.sources, args.destination, prefix)
+        else:
+            jsonlines_to_jsontable(args.sources, args.destination, args.name)
+    except ValueError as error:
+        print(error, file=sys.stderr)
+        sys.exit(1)
 
 
 # %%
 if __name__ == '__main__':
     import argparse, sys
     parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "--json-backend",
+        default=None,
+        choices=("auto",) + JSONCodec.backends,
+        help="json library to use, by default from $JMT_JSON_BACKEND or auto",
+        )
+    parser.add_argument(
+        "--no-strict-json",
+        dest="strict_json",
+        action="store_const",
+        const=False,
+        default=None,
+        help="write with the faster json library (output not byte-identical)",
+        )
     parser_subparsers = parser.add_subparsers(
         dest="command",
         title="subcommands",
@@ -397,9 +3187,15 @@ if __name__ == '__main__':
             )
         subparser.add_argument(
             "query",
-            help="the file on which to perform the query",
+            help="the SQL query to execute",
             type=str,
             )
+        subparser.add_argument(
+            "--no-cache",
+            dest="cache",
+            action="store_false",
+            help="don't use the cached sqlite version of the file",
+            )
     
     subparser = parser_subparsers.add_parser(
         'example',
@@ -414,6 +3210,62 @@ if __name__ == '__main__':
             type=str,
             )
 
+    subparser = parser_subparsers.add_parser(
+        'index',
+        help="build the index of a jtm file for random access",
+        )
+    if "indentation for sub command":
+        subparser.add_argument(
+            "source_filename",
+            help="the jtm file to index",
+            type=str,
+            )
+        subparser.add_argument(
+            "index_filename",
+            default=None,
+            nargs='?',
+            help="where to save the index, by default the source plus .jmti",
+            type=str,
+            )
+
+    subparser = parser_subparsers.add_parser(
+        'ls',
+        help="list the tables of a jtm file, with columns and number of rows",
+        )
+    if "indentation for sub command":
+        subparser.add_argument(
+            "source_filename",
+            default="-",
+            nargs='?',
+            help="the jtm file to list, by default stdin",
+            type=str,
+            )
+
+    subparser = parser_subparsers.add_parser(
+        'tail',
+        help="write the last rows of the last table (or of a named one)",
+        )
+    if "indentation for sub command":
+        subparser.add_argument(
+            "source_filename",
+            default="-",
+            nargs='?',
+            help="the jtm file to read, by default stdin",
+            type=str,
+            )
+        subparser.add_argument(
+            "-n", "--lines",
+            default=10,
+            help="the number of rows to write",
+            type=int,
+            )
+        subparser.add_argument(
+            "--table",
+            default=None,
+            help="the name of the table, by default the last one of the file",
+            type=str,
+            )
+
     subparser = parser_subparsers.add_parser(
         'xlsx2jtm',
         help="parse a xlsx file into a jtm",
@@ -490,12 +3342,67 @@ if __name__ == '__main__':
             )
         subparser.add_argument(
             "source_filename",
-            help="",
+            default="-",
+            nargs='?',
+            help="the file to filter, by default stdin",
             type=str,
             )
         subparser.add_argument(
             "destination_filename",
-            help="",
+            default="-",
+            nargs='?',
+            help="where to write the tables, by default stdout",
+            type=str,
+            )
+        subparser.add_argument(
+            "-v", "--drop",
+            action="store_true",
+            help="drop the tables that match the regex, keep the others",
+            )
+
+    # first it decides which tables to keep, then which to remove of the kept ones
+    # then applies the same logic to the lines of each table
+    subparser = parser_subparsers.add_parser(
+        'grep',
+        help="select a subset of tables and lines from a jtm file, streaming",
+        )
+    if "indentation for sub command":
+        subparser.add_argument(
+            "--keep-table",
+            default=None,
+            help="regex that matches the name of the tables to keep",
+            type=str,
+            )
+        subparser.add_argument(
+            "--drop-table",
+            default=None,
+            help="regex that matches the name of the tables to remove",
+            type=str,
+            )
+        subparser.add_argument(
+            "--keep-line",
+            action="append",
+            default=[],
+            help="keep the rows that satisfy a condition like 'age > 30'",
+            type=str,
+            )
+        subparser.add_argument(
+            "--drop-line",
+            action="append",
+            default=[],
+            help="remove the rows that satisfy a condition like 'name ~ ^al'",
+            type=str,
+            )
+        subparser.add_argument(
+            "-i", "--input",
+            default="-",
+            help="the file to read, by default stdin",
+            type=str,
+            )
+        subparser.add_argument(
+            "-o", "--output",
+            default="-",
+            help="the file to write, by default stdout",
             type=str,
             )
 
@@ -506,9 +3413,28 @@ if __name__ == '__main__':
     if "indentation for sub command":
         subparser.add_argument(
             "source",
-            help="source jtm file",
+            default="-",
+            nargs='?',
+            help="source jtm file, by default stdin",
+            type=str,
+            )
+        subparser.add_argument(
+            "--stdout",
+            action="store_true",
+            help="write the rows of all the tables to stdout",
+            )
+        subparser.add_argument(
+            "-d", "--directory",
+            default=".",
+            help="where to write the jsonl files",
             type=str,
             )
+        subparser.add_argument(
+            "-j", "--workers",
+            default=None,
+            help="number of processes writing the files, by default one per cpu",
+            type=int,
+            )
 
     subparser = parser_subparsers.add_parser(
         'jsonl2jtm',
@@ -517,22 +3443,42 @@ if __name__ == '__main__':
     if "indentation for sub command":
         subparser.add_argument(
             "destination",
-            help="",
+            help="the jtm file to write, - for stdout",
             type=str,
             )
         subparser.add_argument(
             "sources",
-            help="source jsonl files",
+            default=["-"],
+            help="source jsonl files, by default stdin",
+            type=str,
+            nargs='*',
+            )
+        subparser.add_argument(
+            "--name",
+            action="append",
+            default=[],
+            help="name of the table of each source, needed for stdin",
             type=str,
-            nargs='+',
+            )
+        subparser.add_argument(
+            "--split",
+            action="store_true",
+            help="a table for each set of keys, named as --name plus a number",
             )
 
     # start the actual parsing and defer
     args = parser.parse_args()  
+    set_json_backend(args.json_backend, args.strict_json)
     if args.command == "query":
         main_query(args)
     elif args.command == "example":
         main_example(args)
+    elif args.command == "index":
+        main_index(args)
+    elif args.command == "ls":
+        main_ls(args)
+    elif args.command == "tail":
+        main_tail(args)
     elif args.command == "xlsx2jtm":
         main_xlsx2jtm(args)
     elif args.command == "jtm2xlsx":
@@ -543,6 +3489,8 @@ if __name__ == '__main__':
         main_jtm2sqlite(args)
     elif args.command == "filter":
         main_filter(args)
+    elif args.command == "grep":
+        main_grep(args)
     elif args.command == "jtm2jsonl":
         main_jtm2jsonl(args)
     elif args.command == "jsonl2jtm":
@@ -557,15 +3505,8 @@ if __name__ == '__main__':
     
 # ./jtm.py query test.jtbl "SELECT * from ages INNER JOIN wealths ON ages.name==wealths.name" | vd -f json
 
-# TODO: make the filter function a streaming one
-# TODO: make filter accept stdin and stdout
-# TODO: make filter able to filter in or filter out based on a switch
 # TODO: accept from stdin for the jtm2xlsx and jtm2sqlite
 # TODO: able to output to stdout for xlsx2jtm and sqlite2jtm
 
-# TODO: add a function to calculate the index as an external jtm file
-# TODO: add random access to a table if an index is provided
-
 # TODO: read and write from CSV/TSV
 # TODO: read and write from HDF5
-# TODO: read and write numpy style arrays... decide for a precise definition
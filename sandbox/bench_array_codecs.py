@@ -0,0 +1,79 @@
+# -*- coding: utf-8 -*-
+"""compression ratio and speed of the codecs of the array cells.
+
+run from the root of the repository:
+    python -m sandbox.bench_array_codecs [size]
+
+for each kind of array (dtype and content) and each codec spec, it reports
+the compression ratio and the MB/s of encoding and decoding, measured on
+the uncompressed size. The base64 step of the cells is not included.
+"""
+# %% do imports
+import sys
+import time
+
+import numpy as np
+
+from jmt.arrays import get_codec
+
+SPECS = [
+    "none",
+    {"codec": "zlib", "level": 1},
+    {"codec": "zlib", "level": 6},
+    {"codec": "zlib", "level": 9},
+    {"codec": "zlib", "level": 1, "shuffle": True},
+    {"codec": "zlib", "level": 6, "shuffle": True},
+    "gzip",
+    {"codec": "bz2", "level": 9},
+    {"codec": "bz2", "level": 9, "shuffle": True},
+    {"codec": "lzma", "preset": 1},
+    {"codec": "lzma", "preset": 6},
+    {"codec": "lzma", "preset": 1, "shuffle": True},
+    ]
+
+# %%
+
+def generate_arrays(size):
+    """typical contents of the array cells, about size bytes each"""
+    rng = np.random.default_rng(42)
+    side = int(np.sqrt(size))
+    y, x = np.mgrid[0:side, 0:side] / side
+    smooth = np.sin(6 * x) * np.cos(4 * y)
+    return {
+        "uint8 image": (127 * (smooth + 1) + rng.normal(0, 4, smooth.shape)).astype("uint8"),
+        "int32 counts": rng.poisson(20, size // 4).astype("int32"),
+        "int64 ids": np.arange(size // 8, dtype="int64") * 3 + 1_000_000,
+        "float32 signal": (smooth + rng.normal(0, 0.01, smooth.shape)).astype("float32"),
+        "float64 random": rng.random(size // 8),
+        }
+
+def best_of(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function()
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def describe(spec):
+    if isinstance(spec, str):
+        return spec
+    params = ",".join("{}={}".format(k, v) for k, v in spec.items() if k != "codec")
+    return "{}({})".format(spec["codec"], params)
+
+# %%
+if __name__ == '__main__':
+    size = int(sys.argv[1]) if len(sys.argv) > 1 else 2**22
+    print("{:>16} {:>28} {:>8} {:>12} {:>12}".format(
+        "array", "codec", "ratio", "encode MB/s", "decode MB/s"))
+    for kind, arr in generate_arrays(size).items():
+        megabytes = arr.nbytes / 2**20
+        for spec in SPECS:
+            codec = get_codec(spec)
+            encoding, compressed = best_of(lambda: codec.compress(arr))
+            decoding, data = best_of(lambda: codec.decompress(compressed, arr.dtype))
+            assert data == arr.tobytes()
+            print("{:>16} {:>28} {:>8.2f} {:>12.1f} {:>12.1f}".format(
+                kind, describe(spec), arr.nbytes / len(compressed),
+                megabytes / encoding, megabytes / decoding))
+        print()
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""cold and warm reading of a jmt file through the binary columns cache.
+
+run from the root of the repository:
+    python -m sandbox.bench_columns_cache [rows]
+
+it compares parsing the json with the first read (that builds the cache)
+and the following ones, that memory map the numeric columns.
+"""
+# %% do imports
+import os
+import sys
+import time
+import random
+import tempfile
+
+from jmt.jmt import read_from_jsontable
+
+# %%
+
+def generate_file(filename, rows):
+    random.seed(42)
+    with open(filename, "w", encoding="utf8") as outfile:
+        print('{"name": "bench", "columns": ["id", "x", "y", "flag"]}', file=outfile)
+        for row in range(rows):
+            line = '[{}, {}, {}, {}]'
+            values = row, random.random(), random.random(), "true" if row % 2 else "false"
+            print(line.format(*values), file=outfile)
+
+def timeit(function, *args, **kwargs):
+    start = time.perf_counter()
+    function(*args, **kwargs)
+    return time.perf_counter() - start
+
+# %%
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "bench.jtm")
+        cache_dir = os.path.join(directory, "cache")
+        generate_file(filename, rows)
+        size = os.path.getsize(filename) / 2**20
+        print("file of {} rows, {:.1f} MB".format(rows, size))
+        parse = timeit(read_from_jsontable, filename, columnar=True)
+        cold = timeit(read_from_jsontable, filename, cache=cache_dir)
+        warm = min(
+            timeit(read_from_jsontable, filename, cache=cache_dir)
+            for _ in range(5)
+            )
+        print("{:>10} {:>10} {:>10}".format("read", "seconds", "speedup"))
+        for name, elapsed in [("parse", parse), ("cold", cold), ("warm", warm)]:
+            print("{:>10} {:>10.4f} {:>10.1f}".format(name, elapsed, parse / elapsed))
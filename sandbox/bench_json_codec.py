@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""throughput of the json backends used to read and write jmt lines.
+
+run from the root of the repository:
+    python -m sandbox.bench_json_codec [rows]
+
+for each installed backend, in strict and non strict mode, it reports the
+MB/s of decoding and encoding a set of typical jmt rows.
+"""
+# %% do imports
+import sys
+import time
+import random
+
+from jmt.jmt import JSONCodec, _import_optional
+
+# %%
+
+def generate_rows(rows):
+    random.seed(42)
+    return [
+        [idx, random.random(), "label_{}".format(idx % 97), idx % 2 == 0, None]
+        for idx in range(rows)
+        ]
+
+def best_of(function, repeat=3):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# %%
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    data = generate_rows(rows)
+    reference = JSONCodec("json")
+    encoded = [reference.dumps(row).encode("utf8") for row in data]
+    size = sum(map(len, encoded)) / 2**20
+    print("{} rows, {:.1f} MB".format(rows, size))
+    print("{:>8} {:>8} {:>12} {:>12}".format(
+        "backend", "strict", "loads MB/s", "dumps MB/s"))
+    for backend in JSONCodec.backends:
+        if _import_optional(backend) is None:
+            print("{:>8} not installed".format(backend))
+            continue
+        for strict in (True, False):
+            codec = JSONCodec(backend, strict=strict)
+            loads, dumps = codec.loads, codec.dumps
+            decoding = best_of(lambda: [loads(line) for line in encoded])
+            encoding = best_of(lambda: [dumps(row) for row in data])
+            print("{:>8} {:>8} {:>12.1f} {:>12.1f}".format(
+                backend, str(strict), size / decoding, size / encoding))
@@ -0,0 +1,76 @@
+# -*- coding: utf-8 -*-
+"""benchmark of the parallel jmt reader against the sequential one.
+
+run from the root of the repository:
+    python -m sandbox.bench_parallel_read [rows] [max_workers]
+
+it generates a temporary jmt file and reads it with 1 to max_workers
+processes, reporting the time and the speedup over the sequential reader.
+It also reports the bound on the speedup given by unpickling the rows
+in the main process, which can't be parallelized.
+"""
+# %% do imports
+import os
+import sys
+import time
+import pickle
+import random
+import tempfile
+
+from jmt.jmt import (
+    read_from_jsontable, read_from_jsontable_parallel, _parse_chunk, _gc_paused,
+    )
+
+# %%
+
+def generate_file(filename, rows, tables=4):
+    random.seed(42)
+    with open(filename, "w", encoding="utf8") as outfile:
+        for idx in range(tables):
+            header = '{{"name": "table_{}", "columns": ["id", "x", "label"]}}'
+            print(header.format(idx), file=outfile)
+            for row in range(rows // tables):
+                line = '[{}, {}, "label_{}"]'
+                print(line.format(row, random.random(), row % 97), file=outfile)
+
+def timeit(function, *args, repeat=3, **kwargs):
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        function(*args, **kwargs)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def speedup_bound(filename):
+    """parsing time over unpickling time of the whole file"""
+    size = os.path.getsize(filename)
+    parse = timeit(_parse_chunk, filename, 0, size, repeat=1)
+    pickled = pickle.dumps(_parse_chunk(filename, 0, size), pickle.HIGHEST_PROTOCOL)
+    with _gc_paused():
+        unpickle = timeit(pickle.loads, pickled, repeat=1)
+    return parse / unpickle
+
+# %%
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    max_workers = int(sys.argv[2]) if len(sys.argv) > 2 else os.cpu_count()
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, "bench.jtm")
+        generate_file(filename, rows)
+        size = os.path.getsize(filename) / 2**20
+        # chunks small enough to give work to all the processes
+        chunk_size = max(2**20, os.path.getsize(filename) // (4 * max_workers))
+        base = timeit(read_from_jsontable, filename)
+        print("file of {} rows, {:.1f} MB".format(rows, size))
+        print("speedup bound by unpickling: {:.1f}".format(speedup_bound(filename)))
+        print("{:>10} {:>10} {:>10} {:>10}".format(
+            "workers", "seconds", "MB/s", "speedup"))
+        print("{:>10} {:>10.3f} {:>10.1f} {:>10.2f}".format(
+            "serial", base, size / base, 1.0))
+        for workers in range(1, max_workers + 1):
+            elapsed = timeit(
+                read_from_jsontable_parallel, filename,
+                workers=workers, chunk_size=chunk_size,
+                )
+            print("{:>10} {:>10.3f} {:>10.1f} {:>10.2f}".format(
+                workers, elapsed, size / elapsed, base / elapsed))
@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+"""compare the native sqlite writer with the pandas `to_sql` path.
+
+run from the root of the repository:
+    python -m sandbox.bench_sqlite_writer [rows]
+
+both write the same table in a new sqlite file, with the same pragmas.
+"""
+# %% do imports
+import os
+import sys
+import time
+import random
+import tempfile
+from contextlib import closing
+from sqlite3 import connect
+
+import pandas as pd
+
+from jmt.jmt import Table, write_table_into_sql_connection, _tune_for_bulk_load
+
+# %%
+
+def generate_table(rows):
+    random.seed(42)
+    data = [
+        [idx, random.random(), "label_{}".format(idx % 97), idx % 2 == 0]
+        for idx in range(rows)
+        ]
+    info = {"name": "bench", "columns": ["id", "x", "label", "flag"]}
+    return Table(info=info, data=data)
+
+def write_pandas(table, filename):
+    with closing(connect(filename)) as connection:
+        _tune_for_bulk_load(connection)
+        df = pd.DataFrame(table.data, columns=table.columns)
+        df.to_sql(table.name, con=connection, index=False)
+
+def write_native(table, filename):
+    with closing(connect(filename)) as connection:
+        _tune_for_bulk_load(connection)
+        write_table_into_sql_connection(connection, table.info, iter(table.data))
+
+def best_of(function, table, directory, repeat=3):
+    best = float("inf")
+    for idx in range(repeat):
+        filename = os.path.join(directory, "{}_{}.db".format(function.__name__, idx))
+        start = time.perf_counter()
+        function(table, filename)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+# %%
+if __name__ == '__main__':
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    table = generate_table(rows)
+    with tempfile.TemporaryDirectory() as directory:
+        print("{} rows".format(rows))
+        print("{:>8} {:>10} {:>12}".format("writer", "seconds", "rows/s"))
+        for function in (write_pandas, write_native):
+            elapsed = best_of(function, table, directory)
+            name = function.__name__.split("_")[1]
+            print("{:>8} {:>10.3f} {:>12.0f}".format(name, elapsed, rows / elapsed))
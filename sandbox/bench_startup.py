@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""cold start time of each subcommand of the command line.
+
+run from the root of the repository:
+    python -m sandbox.bench_startup [repeat]
+
+each subcommand is run on a small example file with `python -X importtime`,
+reporting the wall time, the total import time and the heavy libraries
+that got imported. The exit code is 1 if an import time is over budget.
+"""
+# %% do imports
+import os
+import re
+import sys
+import time
+import tempfile
+import contextlib
+import subprocess
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY = ("pandas", "numpy", "openpyxl")
+# budget of the import time in milliseconds, the excel commands need openpyxl
+BUDGETS_MS = {
+    "example": 100,
+    "index": 100,
+    "filter": 100,
+    "tail": 100,
+    "query": 100,
+    "jtm2sqlite": 100,
+    "sqlite2jtm": 100,
+    "jtm2jsonl": 100,
+    "jsonl2jtm": 100,
+    "jtm2xlsx": 400,
+    "xlsx2jtm": 400,
+    }
+# each command with the file it creates, removed before running it again
+COMMANDS = [
+    ("example", ["example", "example.jtm"], None),
+    ("index", ["index", "example.jtm"], None),
+    ("filter", ["filter", "ages", "example.jtm", "filtered.jtm"], None),
+    ("tail", ["tail", "-n", "2", "example.jtm"], None),
+    ("query", ["query", "--no-cache", "example.jtm", "SELECT * FROM ages"], None),
+    ("jtm2sqlite", ["jtm2sqlite", "example.jtm", "example.db"], "example.db"),
+    ("sqlite2jtm", ["sqlite2jtm", "example.db", "from_sqlite.jtm"], None),
+    ("jtm2jsonl", ["jtm2jsonl", "example.jtm"], None),
+    ("jsonl2jtm", ["jsonl2jtm", "from_jsonl.jtm", "ages.jsonl"], None),
+    ("jtm2xlsx", ["jtm2xlsx", "example.jtm", "example.xlsx"], "example.xlsx"),
+    ("xlsx2jtm", ["xlsx2jtm", "example.xlsx", "from_xlsx.jtm"], None),
+    ]
+
+# %%
+
+def run(arguments, output, directory):
+    """run a subcommand, return the wall time, import time and imports"""
+    if output is not None:
+        with contextlib.suppress(FileNotFoundError):
+            os.remove(os.path.join(directory, output))
+    env = dict(os.environ, PYTHONPATH=ROOT)
+    command = [sys.executable, "-X", "importtime", "-m", "jmt.jmt"] + arguments
+    start = time.perf_counter()
+    result = subprocess.run(
+        command, cwd=directory, env=env, capture_output=True, text=True,
+        )
+    elapsed = time.perf_counter() - start
+    result.check_returncode()
+    imports = re.findall(
+        r"import time:\s+(\d+) \|\s+\d+ \|\s+(\S+)", result.stderr,
+        )
+    import_time = sum(int(self_us) for self_us, _ in imports) / 1000
+    modules = {name for _, name in imports}
+    return elapsed * 1000, import_time, [m for m in HEAVY if m in modules]
+
+# %%
+if __name__ == '__main__':
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    over_budget = []
+    print("{:>12} {:>10} {:>10} {:>8}  {}".format(
+        "command", "wall ms", "import ms", "budget", "heavy imports"))
+    with tempfile.TemporaryDirectory() as directory:
+        for name, arguments, output in COMMANDS:
+            runs = [run(arguments, output, directory) for _ in range(repeat)]
+            wall = min(r[0] for r in runs)
+            import_time = min(r[1] for r in runs)
+            heavy = runs[-1][2]
+            budget = BUDGETS_MS[name]
+            if import_time > budget:
+                over_budget.append(name)
+            print("{:>12} {:>10.1f} {:>10.1f} {:>8} {}".format(
+                name, wall, import_time, budget, ", ".join(heavy)))
+    if over_budget:
+        print("over budget: {}".format(", ".join(over_budget)))
+        sys.exit(1)